@@ -1,15 +1,127 @@
+import time # For the fixed-timestep simulation clock and startup timing
+APP_START_TIME = time.perf_counter()
+
 import pygame
 import sys
+import os
+import argparse
+import json
 import math # For rotation and color calculations
 import random # For bacteria rumbling and salt particle starting positions
+import threading # For background slide prefetching
+import concurrent.futures # Worker pool for decoding the game asset groups at startup
+import queue
+import tracemalloc # For the benchmark's allocation pass
+import csv
+import hashlib # For detecting changed source images in the baked asset cache
+import mmap
+import weakref # Textures live exactly as long as the Surfaces they were uploaded from
+import contextlib
+import shutil # For finding the video encoder
+import subprocess # Session capture pipes frames into the encoder
+from array import array # Fixed-size ring buffers for the frame profiler
+from itertools import repeat
+
+try:
+    import numpy # Optional: vectorized salt particle updates
+except ImportError:
+    numpy = None
+from collections import OrderedDict, deque
+
+# --- Command Line ---
+BENCHMARK_MODES = ["slideshow", "game_oxidative_stress", "game_osmotic_shock", "game_enzyme_inhibition"]
+arg_parser = argparse.ArgumentParser(description="Lights Out! Bacteria Game")
+arg_parser.add_argument("--benchmark", choices=BENCHMARK_MODES,
+                        help="Run headless (SDL dummy drivers), drive this mode with synthetic taps and write a JSON report")
+arg_parser.add_argument("--tap-rate", type=float, default=8.0, help="Synthetic taps (or slide clicks) per second in benchmark mode")
+arg_parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run in benchmark mode")
+arg_parser.add_argument("--benchmark-trace-allocations", action="store_true",
+                        help="Trace each frame's allocations with tracemalloc in benchmark mode; the slowed-down timings are left out of the report")
+arg_parser.add_argument("--benchmark-output", default="benchmark_run.json", help="Where benchmark mode writes its JSON report")
+arg_parser.add_argument("--profile-csv", help="Dump the frame profiler's ring buffer to this CSV file on exit")
+arg_parser.add_argument("--bake-assets", action="store_true", help="Decode, scale and bake every image into the asset cache, then exit")
+arg_parser.add_argument("--slide-graph", default="slide_graph.json", help="Declarative slide, button and game-trigger graph")
+arg_parser.add_argument("--dump-slide-graph", metavar="PATH", help="Write the compiled slide graph (edges, reachability) as JSON to PATH and exit")
+arg_parser.add_argument("--render-size", help="Internal render resolution as WIDTHxHEIGHT (e.g. 1280x720); frames are upscaled to the window")
+arg_parser.add_argument("--record-input", metavar="PATH", help="Record this session's input, clock and random seed to a replayable log")
+arg_parser.add_argument("--replay-input", metavar="PATH", help="Replay a log written by --record-input (as fast as possible unless --replay-realtime)")
+arg_parser.add_argument("--replay-realtime", action="store_true", help="Pace --replay-input at the recorded speed")
+arg_parser.add_argument("--seed", type=int, help="Seed for the random module (rumble, salt placement)")
+arg_parser.add_argument("--players", type=int, choices=[1, 2, 3, 4], default=1,
+                        help="Classroom mode: 2-4 players share the screen, each tapping their own key")
+arg_parser.add_argument("--render-backend", choices=["surface", "texture", "texture-software"], default="surface",
+                        help="Draw with software surfaces (default) or SDL renderer textures; 'texture' falls back to the "
+                             "software renderer, then to surfaces, when no GPU renderer is available")
+arg_parser.add_argument("--asset-memory-budget", type=float, metavar="MB",
+                        help="Warn when the surfaces held by assets, caches and the HUD exceed this many MB")
+arg_parser.add_argument("--low-latency", action="store_true",
+                        help="In the games, sleep before polling input instead of after presenting, so taps reach the screen sooner")
+arg_parser.add_argument("--prefetch-transforms", action="store_true",
+                        help="Build the rotations and scales the next frame is predicted to need on a worker thread (experimental)")
+arg_parser.add_argument("--telemetry-dir", metavar="DIR", help="Write gameplay analytics (taps, time to kill, slides, frame times) as JSONL files to DIR")
+arg_parser.add_argument("--capture-video", metavar="PATH",
+                        help="Record the session's frames to PATH, encoded by ffmpeg when it is installed; "
+                             "otherwise (or for a .raw PATH) as raw frames described by PATH.json")
+arg_parser.add_argument("--capture-fps", type=float, default=30.0, help="Frame rate of --capture-video; faster frames are skipped")
+cli_args = arg_parser.parse_args()
+if cli_args.record_input and cli_args.replay_input:
+    arg_parser.error("--record-input and --replay-input cannot be combined")
+if cli_args.benchmark and (cli_args.record_input or cli_args.replay_input):
+    arg_parser.error("--benchmark drives its own input and cannot be recorded or replayed")
+if cli_args.capture_fps <= 0:
+    arg_parser.error("--capture-fps must be positive")
+
+if cli_args.benchmark or cli_args.bake_assets or cli_args.dump_slide_graph:
+    # Headless runs and tooling commands need no window or sound device (baked pixels are
+    # stored as BGRA and converted when mapped, whatever the real display's layout)
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
 
 # --- Initialization ---
 pygame.init()
 pygame.mixer.init()
 
 # --- Constants ---
-SCREEN_WIDTH = 1920
-SCREEN_HEIGHT = 1080
+# Layout (positions, rects, sprite and font sizes) is authored for DESIGN_WIDTH x DESIGN_HEIGHT.
+# Frames are composited at the internal render resolution SCREEN_WIDTH x SCREEN_HEIGHT and
+# upscaled once to the window by SDL (pygame.SCALED) when the two differ, so weak machines
+# can trade sharpness for fill rate.
+DESIGN_WIDTH = 1920
+DESIGN_HEIGHT = 1080
+RENDER_SIZE = (DESIGN_WIDTH, DESIGN_HEIGHT) # e.g. (1280, 720) or (960, 540) on low-end kiosks
+if cli_args.render_size:
+    try:
+        RENDER_SIZE = tuple(int(part) for part in cli_args.render_size.lower().split("x"))
+        if len(RENDER_SIZE) != 2 or min(RENDER_SIZE) <= 0:
+            raise ValueError
+    except ValueError:
+        arg_parser.error(f"--render-size must look like 1280x720, got {cli_args.render_size!r}")
+SCREEN_WIDTH, SCREEN_HEIGHT = RENDER_SIZE
+RENDER_SCALE_X = SCREEN_WIDTH / DESIGN_WIDTH
+RENDER_SCALE_Y = SCREEN_HEIGHT / DESIGN_HEIGHT
+RENDER_SCALE = min(RENDER_SCALE_X, RENDER_SCALE_Y) # For lengths that must keep their aspect (fonts, sprites, offsets)
+
+# Design-space to render-space conversions for layout constants
+def render_x(x):
+    return int(round(x * RENDER_SCALE_X))
+
+def render_y(y):
+    return int(round(y * RENDER_SCALE_Y))
+
+def render_point(point):
+    return (render_x(point[0]), render_y(point[1]))
+
+def render_size(size):
+    return (max(1, render_x(size[0])), max(1, render_y(size[1])))
+
+def render_rect(rect):
+    left, top = render_point(rect.topleft)
+    right, bottom = render_point(rect.bottomright)
+    return pygame.Rect(left, top, max(1, right - left), max(1, bottom - top))
+
+def render_length(length):
+    return max(1, int(round(length * RENDER_SCALE)))
+
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 LIGHT_GRAY = (200, 200, 200)
@@ -18,42 +130,113 @@ GREEN = (0, 255, 0)
 YELLOW = (255, 255, 0)
 RED = (255, 0, 0)
 
-MAX_RUMBLE_OFFSET = 10 # Max pixels the bacteria will shift in X or Y for the rumble.
+MAX_RUMBLE_OFFSET = render_length(10) # Max pixels the bacteria will shift in X or Y for the rumble.
 
 # Game Mechanics Constants (can be tuned per game if needed)
 HEALTH_MAX = 100.0
 HEALTH_MIN = 0.0
-REGEN_RATE = 0.35  # Health points regenerated per frame (adjust for difficulty)
+REGEN_RATE = 0.35  # Health points regenerated per simulation tick (adjust for difficulty)
 DAMAGE_PER_TAP = 5.0 # Health points lost per spacebar tap (adjust)
 
+# Game simulation runs at a fixed tick rate, independent of how fast frames are rendered.
+# REGEN_RATE, SALT_PARTICLE_SPEED_Y and FLASH_DURATION_FRAMES are all per tick.
+SIM_TICK_RATE = 60
+SIM_TICK_SECONDS = 1.0 / SIM_TICK_RATE
+MAX_SIM_TICKS_PER_FRAME = 8 # After a long stall, drop simulation time instead of fast-forwarding
+
 # Oxidative Stress Game Specific Constants
 MAX_SCALE_ROTATION_DEGREES = 30
+SCALE_ROTATION_STEP_DEGREES = 3.0 # Scale balance angles are snapped to this step so rotations can be cached; one tap moves the balance 3 degrees
+SCALE_ROTATION_CACHE_BUDGET_BYTES = 24 * 1024 * 1024 # Each rotated balance is ~3-4 MB: the current angle and the last few it passed through
+SCALE_ROTATION_CACHE_WARM = False # True: build the rotations nearest the start-of-game angle at startup, as many as the budget holds
+TRANSFORM_PREFETCH_ENABLED = False # A worker thread builds the cached sprites the next frame is predicted to need (also --prefetch-transforms)
+TRANSFORM_PREFETCH_MIN_PIXELS = 256 * 256 # Smaller transforms finish faster than handing them to the worker
 
 # Osmotic Shock Game Specific Constants
-OSMOTIC_GAME_INFO_SLIDE_INDEX = 10  # Slide "17.png"
-OSMOTIC_GAME_BOOM_SLIDE_INDEX = 11  # Slide "24.png"
-NUM_SALT_PARTICLES = 16
+NUM_SALT_PARTICLES = 16 # Beyond len(SALT_X_POSITIONS), extra particles get random columns; blit cost grows with the count
 MIN_BACTERIA_OSMO_SCALE = 0.2  # Bacteria shrinks to 20% of its original size at 0 health
-SALT_PARTICLE_SPEED_Y = 15      # Speed of salt particles moving up/down
+BACTERIA_OSMO_SCALE_LEVELS = 101 # Pre-scaled sizes between MIN_BACTERIA_OSMO_SCALE and 1.0 (one per health point)
+BACTERIA_OSMO_SCALE_CACHE_BUDGET_BYTES = 32 * 1024 * 1024
+SALT_PARTICLE_SPEED_Y = render_length(15) # Speed of salt particles moving up/down (pixels per tick)
+SALT_PARTICLE_DIRTY_RECT_LIMIT = 64 # Above this many visible particles, one bounding rect is marked dirty instead of one per particle
 
 # Enzyme Inhibition Game Specific Constants
-ENZYME_GAME_INFO_SLIDE_INDICES = [6, 7]  # Slides "10.png" and "11.png"
-ENZYME_GAME_BOOM_SLIDE_INDEX = 8      # Slide "15.png"
-
 # Inhibitor movement parameters
-INHIBITOR_START_X = 0
-INHIBITOR_END_X = -1200
-INHIBITOR_Y = 0
+INHIBITOR_START_X = render_x(0)
+INHIBITOR_END_X = render_x(-1200)
+INHIBITOR_Y = render_y(0)
 
-HEALTH_BAR_POS_EI = (SCREEN_WIDTH * 0.6, SCREEN_HEIGHT * 0.3)
-HEALTH_BAR_SIZE_EI = (400, 40)
+HEALTH_BAR_POS_EI = render_point((DESIGN_WIDTH * 0.6, DESIGN_HEIGHT * 0.3))
+HEALTH_BAR_SIZE_EI = render_size((400, 40))
 
 # Flash effect variables
-TAP_BUTTON_VISUAL_RECT = pygame.Rect(677, 41, 566, 201)
-FLASH_DURATION_FRAMES = 3
+TAP_BUTTON_VISUAL_RECT = render_rect(pygame.Rect(677, 41, 566, 201))
+FLASH_DURATION_FRAMES = 3 # Simulation ticks the tap flash stays visible
 FLASH_COLOR = (255, 255, 255, 180) # White flash with some transparency
 
+# Classroom mode (--players 2-4): the screen is split into one viewport per player
+CLASSROOM_PLAYER_KEYS = [pygame.K_q, pygame.K_p, pygame.K_z, pygame.K_m] # Tap keys for players 1-4, far apart on the keyboard
+CLASSROOM_FINISHED_SHADE = (0, 0, 0, 150) # Darkens the viewport of a player whose bacteria is knocked out
+HEALTH_BAR_COLOR_LEVELS = 511 # Precomputed green -> yellow -> red bar colours (one per colour channel step)
+
+# Baked asset cache: decoded, converted and scaled pixels are stored raw and memory-mapped on later launches
+ASSET_CACHE_ENABLED = True
+ASSET_CACHE_DIR = ".asset_cache"
+
+# Slide cache: full-screen images are decoded on demand and kept in an LRU under a byte budget
+FULLSCREEN_SURFACE_BYTES = SCREEN_WIDTH * SCREEN_HEIGHT * 4 # One 32-bit full-screen surface (~8 MB at 1080p)
+SLIDE_CACHE_BUDGET_BYTES = 6 * FULLSCREEN_SURFACE_BYTES # Current slide plus its reachable neighbours
+ENZYME_STATE_CACHE_BUDGET_BYTES = 3 * FULLSCREEN_SURFACE_BYTES # All three enzyme states fit at once
+SLIDE_PREFETCH_ENABLED = True # Decode slides reachable through buttons on a background thread
+ASSET_LOADER_WORKERS = min(4, os.cpu_count() or 1) # Threads decoding the game asset groups at startup
+
+# Asset memory registry: every long-lived Surface is tracked by asset group for sizing kiosk RAM
+ASSET_MEMORY_BUDGET_MB = 224 # A warning is printed when tracked surfaces exceed this (--asset-memory-budget overrides); a full session peaks near 200 MB
+ASSET_MEMORY_REPORT_KEY = pygame.K_F4 # Prints the asset memory report
+
+# Sprite atlas: small sprites drawn as-is that come in sets (the bacteria states) share one surface;
+# a sprite drawn on its own (salt, inhibitor) is only trimmed
+SPRITE_ATLAS_PADDING = 2 # Transparent pixels between packed sprites, so smoothscaled copies never pick up a neighbour
+
+# Scene layers: the static full-screen parts of a game scene, pre-composited into one opaque surface
+ENZYME_LAYER_CACHE_BUDGET_BYTES = 2 * FULLSCREEN_SURFACE_BYTES # Background plus the enzyme state on screen and the one it switches to
+OSMOTIC_HUE_STEP_DEGREES = 3 # Osmotic background hues are snapped to this step (91 colours from red to cyan)
+OSMOTIC_LAYER_CACHE_BUDGET_BYTES = 2 * FULLSCREEN_SURFACE_BYTES # The current hue step and the one just left; regen and taps rarely return further back
+
+# Rendering
+USE_DIRTY_RECT_RENDERING = True # False: repaint the whole screen and flip every frame
+GAME_FPS = 60 # Render cap while a game (or a slide transition) is running (0: uncapped)
+SLIDESHOW_IDLE_WAIT = True # Slideshow sleeps in pygame.event.wait until input arrives instead of polling
+SLIDESHOW_ATTRACT_FPS = 2 # Wake-ups per second on an idle slide (0: sleep until input)
+
+# Frame profiler
+PROFILER_CAPACITY = 3600 # Frames kept in the ring buffer (one minute at 60 FPS)
+PROFILER_ROLLING_FRAMES = 120 # Frames averaged in the overlay
+PROFILER_OVERLAY_KEY = pygame.K_F3 # Toggles the timing overlay
+PROFILER_OVERLAY_REFRESH_SECONDS = 0.25 # Overlay text is re-rendered at most this often
+
+# Tap latency: every game tap is timed from its arrival to the present that first shows its effect
+TAP_LATENCY_BUCKET_MS = 4 # Histogram bucket width
+TAP_LATENCY_BUCKETS = 25 # Buckets up to 100 ms; slower taps are counted in the last one
+LOW_LATENCY_WORK_HISTORY = 60 # Frames of work time the --low-latency frame pacer predicts the next frame from
+LOW_LATENCY_WORK_PERCENTILE = 0.9 # Predicted work: this percentile of the history (the odd slower frame just presents late)
+LOW_LATENCY_SAFETY_MS = 1.0 # Headroom left between the predicted end of a frame and its present deadline
+
+# Audio: every sound class plays on its own reserved mixer channels
+AUDIO_TAP_VOICES = 6 # Round-robin pool for spacebar taps; the oldest tap is cut off when all are busy
+AUDIO_BEEP_VOICES = 2
+AUDIO_VOLUME_CHANGE_THRESHOLD = 1.0 / 128 # SDL_mixer volume resolution; smaller changes are not pushed
+
+# Session telemetry (--telemetry-dir): the main loop only queues events, a background thread writes them
+TELEMETRY_QUEUE_SIZE = 8192 # Events waiting for the writer; when full, new events are dropped (and counted) rather than waited on
+TELEMETRY_BATCH_SIZE = 256 # Lines written and flushed together
+TELEMETRY_FLUSH_SECONDS = 1.0 # A smaller batch is flushed once it is this old
+TELEMETRY_FILE_MAX_BYTES = 1024 * 1024 # The writer moves on to a new JSONL file past this size
+VIDEO_CAPTURE_RING_FRAMES = 6 # Preallocated frame buffers; when all are waiting for the writer, new frames are dropped
+VIDEO_CAPTURE_ENCODER = "ffmpeg" # Encoder the capture is piped into when it is on the PATH
+
 # --- Load Sound Assets ---
+sound_effects_loaded = True
 try:
     button_beep_sound = pygame.mixer.Sound("button_beep.wav")
     button_beep_sound.set_volume(0.14)
@@ -65,166 +248,1377 @@ try:
     game_finish_sound.set_volume(0.08)
 
     rumble_loop_sound = pygame.mixer.Sound("rumble_loop.wav")
-except pygame.error as e:
+except (pygame.error, OSError) as e: # A missing file raises FileNotFoundError
     print(f"Warning: Could not load one or more sound effects - {e}")
-    class DummySound:
-        def play(self, loops=0): pass
-        def stop(self): pass
-        def set_volume(self, volume): pass
-        def get_num_channels(self): return 0
-    button_beep_sound = DummySound()
-    space_tap_sound = DummySound()
-    game_finish_sound = DummySound()
-    rumble_loop_sound = DummySound()
-
-# --- Load Background Music ---
-background_music_loaded_successfully = False # Flag to track if music loaded
-try:
-    pygame.mixer.music.load("background_music.mp3")
-    background_music_loaded_successfully = True
-    print("DEBUG: Background music 'background_music.mp3' loaded successfully.")
-except pygame.error as e:
-    print(f"Warning: Could not load background music 'background_music.mp3' - {e}")
-    print("DEBUG: Background music loading failed.")
+    sound_effects_loaded = False # AudioManager stays silent
+    button_beep_sound = space_tap_sound = game_finish_sound = rumble_loop_sound = None
+
+background_music_loaded_successfully = False # Set by load_background_music() on the asset loader pool
+
+class AudioManager:
+    # Owns the mixer channels for the sound effects. The rumble loop, the finish jingle,
+    # button beeps and spacebar taps each get reserved Channels, so they never compete for
+    # free channels (and background Sound.play() calls cannot steal them). Taps and beeps
+    # rotate through their voice pools without polling the mixer. The rumble volume is only
+    # pushed to the mixer when it moves by AUDIO_VOLUME_CHANGE_THRESHOLD or more.
+    def __init__(self, beep_sound, tap_sound, finish_sound, rumble_sound, enabled):
+        self.beep_sound = beep_sound
+        self.tap_sound = tap_sound
+        self.finish_sound = finish_sound
+        self.rumble_sound = rumble_sound
+        self.enabled = enabled
+        self.volume_updates = 0
+        self.volume_updates_skipped = 0
+        self._rumble_volume = None # Last volume pushed to the rumble channel
+        self._rumble_playing = False
+        self._next_tap_voice = 0
+        self._next_beep_voice = 0
+        if not enabled:
+            return
+        reserved = 2 + AUDIO_BEEP_VOICES + AUDIO_TAP_VOICES
+        if pygame.mixer.get_num_channels() < reserved:
+            pygame.mixer.set_num_channels(reserved)
+        pygame.mixer.set_reserved(reserved)
+        channels = [pygame.mixer.Channel(i) for i in range(reserved)]
+        self.rumble_channel = channels[0]
+        self.finish_channel = channels[1]
+        self.beep_channels = channels[2:2 + AUDIO_BEEP_VOICES]
+        self.tap_channels = channels[2 + AUDIO_BEEP_VOICES:]
+
+    def play_beep(self):
+        if self.enabled:
+            self.beep_channels[self._next_beep_voice].play(self.beep_sound)
+            self._next_beep_voice = (self._next_beep_voice + 1) % len(self.beep_channels)
+
+    def play_tap(self):
+        if self.enabled: # Channel.play() cuts off whatever the voice was still playing
+            self.tap_channels[self._next_tap_voice].play(self.tap_sound)
+            self._next_tap_voice = (self._next_tap_voice + 1) % len(self.tap_channels)
+
+    def play_finish(self):
+        if self.enabled:
+            self.finish_channel.play(self.finish_sound)
+
+    def start_rumble(self):
+        # Starts the loop silent (the volume rises with damage); a loop already playing continues
+        self.set_rumble_volume(0.0)
+        if self.enabled and not self._rumble_playing:
+            self.rumble_channel.play(self.rumble_sound, loops=-1)
+            self._rumble_playing = True
+
+    def stop_rumble(self):
+        if self.enabled and self._rumble_playing:
+            self.rumble_channel.stop()
+            self._rumble_playing = False
+
+    def set_rumble_volume(self, volume):
+        volume = min(1.0, max(0.0, volume))
+        previous = self._rumble_volume
+        if previous is not None and abs(volume - previous) < AUDIO_VOLUME_CHANGE_THRESHOLD and (volume != 0.0 or previous == 0.0):
+            self.volume_updates_skipped += 1
+            return
+        self._rumble_volume = volume
+        self.volume_updates += 1
+        if self.enabled:
+            self.rumble_channel.set_volume(volume)
+
+    def stats_line(self):
+        return f"Audio: {self.volume_updates} rumble volume updates pushed, {self.volume_updates_skipped} skipped"
+
+audio = AudioManager(button_beep_sound, space_tap_sound, game_finish_sound, rumble_loop_sound, sound_effects_loaded)
+
+# --- Texture Backend ---
+# With --render-backend texture the frame is drawn through a pygame._sdl2.video Renderer:
+# every Surface is uploaded once as a Texture, and rotation, scaling and alpha are applied by
+# the renderer at draw time. TextureCanvas stands in for the display surface, so the scenes
+# draw the same way on either backend.
+def open_texture_renderer(software_only):
+    # A Renderer for a new window (accelerated if possible, else SDL's software renderer),
+    # or None to fall back to the surface path
+    try:
+        from pygame._sdl2.video import Window, Renderer
+    except ImportError as e:
+        print(f"Warning: Texture backend unavailable ({e}); using surface rendering.")
+        return None
+    os.environ.setdefault("SDL_RENDER_SCALE_QUALITY", "1") # Linear filtering when textures are scaled, like smoothscale
+    try:
+        window = Window("Lights Out! Bacteria Game", size=(DESIGN_WIDTH, DESIGN_HEIGHT))
+    except (pygame.error, RuntimeError) as e: # pygame._sdl2 raises its own RuntimeError subclass
+        print(f"Warning: Could not open a texture backend window ({e}); using surface rendering.")
+        return None
+    for accelerated in ([0] if software_only else [1, 0]):
+        kind = "accelerated" if accelerated else "software"
+        try:
+            texture_renderer = Renderer(window, accelerated=accelerated)
+        except (pygame.error, RuntimeError) as e:
+            print(f"Warning: Could not create the {kind} renderer ({e}).")
+            continue
+        texture_renderer.logical_size = (SCREEN_WIDTH, SCREEN_HEIGHT) # The GPU upscales to the window, like SCALED
+        print(f"DEBUG: Texture backend using the {kind} renderer at {SCREEN_WIDTH}x{SCREEN_HEIGHT}.")
+        return texture_renderer
+    window.destroy()
+    print("Warning: No SDL renderer available; using surface rendering.")
+    return None
+
+SDL_BLENDMODE_BLEND = 1 # pygame._sdl2 takes SDL's blend mode values
+
+class TextureSprite:
+    # A sprite the renderer transforms as it draws it: `source` drawn at `size`, rotated by
+    # `angle` degrees (counter-clockwise, like pygame.transform.rotate) with `alpha` applied,
+    # over a rectangle of `fill_color` if one is given.
+    # get_size()/get_rect() report the bounding box the equivalent transformed Surface would
+    # have, so callers position it exactly as they would the software sprite.
+    def __init__(self, source, size, angle=0.0, alpha=255, fill_color=None):
+        self.source = source
+        self.size = size
+        self.angle = angle
+        self.alpha = alpha
+        self.fill_color = fill_color
+        if angle:
+            radians = math.radians(angle)
+            cos_a, sin_a = abs(math.cos(radians)), abs(math.sin(radians))
+            self._box_size = (math.ceil(size[0] * cos_a + size[1] * sin_a), math.ceil(size[0] * sin_a + size[1] * cos_a))
+        else:
+            self._box_size = size
+
+    def get_size(self):
+        return self._box_size
+
+    def get_width(self):
+        return self._box_size[0]
+
+    def get_height(self):
+        return self._box_size[1]
+
+    def get_rect(self, **kwargs):
+        rect = pygame.Rect((0, 0), self._box_size)
+        for name, value in kwargs.items():
+            setattr(rect, name, value)
+        return rect
+
+class TextureRotations:
+    # Stands in for a RotatedSpriteCache: get(angle) hands out the unrotated source and the
+    # renderer rotates it by the exact angle
+    def __init__(self, cache):
+        self.source = cache.source
+
+    def get(self, angle):
+        return TextureSprite(self.source, self.source.get_size(), angle=angle)
+
+    def prefetch(self, angle):
+        pass # Nothing to prepare: the renderer rotates at draw time
+
+class TextureScales:
+    # Stands in for a ScaledSpriteCache: get(ratio) hands out the unscaled source and the
+    # renderer draws it at the size the cache would have produced
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, ratio):
+        current_scale = self.cache.min_scale + (1.0 - self.cache.min_scale) * max(0.0, min(1.0, ratio))
+        orig_w, orig_h = self.cache.source.get_size()
+        return TextureSprite(self.cache.source, (max(1, int(orig_w * current_scale)), max(1, int(orig_h * current_scale))))
+
+    def prefetch(self, ratio):
+        pass # Nothing to prepare: the renderer scales at draw time
+
+class TextureOsmoticBackgrounds:
+    # Stands in for an OsmoticBackgroundCache: get(hue) hands out the overlay (the cache's
+    # source) with the hue colour as a fill the renderer draws beneath it, so no composite
+    # is built or uploaded per hue
+    def __init__(self, cache):
+        self.cache = cache
+
+    def quantize(self, hue):
+        return self.cache.quantize(hue)
+
+    def get(self, hue):
+        background_color = pygame.Color(0); background_color.hsla = (hue % 360, 100, 50, 100)
+        return TextureSprite(self.cache.source, self.cache.source.get_size(), fill_color=background_color)
+
+    def prefetch(self, hue):
+        pass # Nothing to prepare: the renderer composites at draw time
+
+class TextureCanvas:
+    # The display surface's stand-in for the texture backend: blit(), blits() and fill()
+    # draw straight through the Renderer, with the same arguments and return values as the
+    # Surface methods (draw_rect() likewise for pygame.draw.rect). Textures are created on first use and dropped with their Surface.
+    def __init__(self, texture_renderer, size):
+        from pygame._sdl2.video import Texture
+        self.renderer = texture_renderer
+        self._texture_type = Texture
+        self._rect = pygame.Rect((0, 0), size)
+        self._textures = weakref.WeakKeyDictionary() # Surface -> Texture
+        self.textures_uploaded = 0
+
+    def get_rect(self):
+        return self._rect.copy()
+
+    def get_size(self):
+        return self._rect.size
+
+    def get_width(self):
+        return self._rect.width
+
+    def get_height(self):
+        return self._rect.height
+
+    def texture_for(self, surface):
+        texture = self._textures.get(surface)
+        if texture is None:
+            texture = self._textures[surface] = self._texture_type.from_surface(self.renderer, surface)
+            self.textures_uploaded += 1
+        return texture
+
+    def blit(self, source, dest, area=None):
+        x, y = (dest.x, dest.y) if isinstance(dest, pygame.Rect) else (int(dest[0]), int(dest[1]))
+        if area is not None and not isinstance(area, pygame.Rect): # Any rect-style value, like Surface.blit
+            area = pygame.Rect(area)
+        if isinstance(source, TextureSprite):
+            if area is None:
+                return self._draw_sprite(source, pygame.Rect((x, y), source.get_size()))
+            # Partly visible: draw the whole sprite through a viewport the size of the visible part
+            visible = pygame.Rect(x, y, area.width, area.height)
+            self.renderer.set_viewport(visible)
+            self._draw_sprite(source, pygame.Rect((-area.x, -area.y), source.get_size()))
+            self.renderer.set_viewport(None)
+            return visible
+        dest_rect = pygame.Rect((x, y), area.size if area else source.get_size())
+        self.texture_for(source).draw(srcrect=area, dstrect=dest_rect)
+        return dest_rect.clip(self._rect)
+
+    def blits(self, blit_sequence, doreturn=True):
+        rects = [self.blit(*item) for item in blit_sequence]
+        return rects if doreturn else None
+
+    def fill(self, color, rect=None):
+        rect = self._rect.copy() if rect is None else pygame.Rect(rect).clip(self._rect)
+        self.renderer.draw_color = pygame.Color(color) # Needs all four channels
+        self.renderer.fill_rect(rect)
+        return rect
+
+    def draw_rect(self, color, rect, width=0):
+        if width <= 0:
+            return self.fill(color, rect)
+        rect = pygame.Rect(rect)
+        self.renderer.draw_color = pygame.Color(color)
+        for inset in range(min(width, (min(rect.size) + 1) // 2)): # One 1px outline per unit of width, inwards like pygame.draw.rect
+            self.renderer.draw_rect(rect.inflate(-2 * inset, -2 * inset))
+        return rect.clip(self._rect)
+
+    def present(self):
+        self.renderer.present()
+
+    def _draw_sprite(self, sprite, box_rect):
+        texture = self.texture_for(sprite.source)
+        draw_rect = pygame.Rect((0, 0), sprite.size)
+        draw_rect.center = box_rect.center
+        if sprite.fill_color is not None:
+            self.renderer.draw_color = sprite.fill_color
+            self.renderer.fill_rect(draw_rect)
+        if sprite.alpha == 255:
+            texture.draw(dstrect=draw_rect, angle=-sprite.angle) # SDL angles run clockwise
+        else: # Alpha modulation needs blending, which textures from opaque surfaces are created without
+            blend_mode = texture.blend_mode
+            texture.alpha, texture.blend_mode = sprite.alpha, SDL_BLENDMODE_BLEND
+            texture.draw(dstrect=draw_rect, angle=-sprite.angle)
+            texture.alpha, texture.blend_mode = 255, blend_mode
+        return box_rect.clip(self._rect)
+
+class TextureFrameRenderer:
+    # DirtyRectRenderer's counterpart for the texture backend. The renderer's back buffer is
+    # undefined after present, so every frame clears and repaints the whole background;
+    # mark() has nothing to track.
+    def __init__(self, canvas):
+        self.canvas = canvas
+
+    def begin_frame(self, scene_key, paint_background):
+        self.canvas.fill(BLACK)
+        paint_background()
+
+    def mark(self, rect):
+        return rect
+
+    def invalidate(self):
+        pass
+
+    def present(self):
+        self.canvas.present()
 
 # --- Screen Setup ---
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+texture_renderer = None # pygame._sdl2.video Renderer while the texture backend is active
+if cli_args.render_backend != "surface":
+    texture_renderer = open_texture_renderer(software_only=(cli_args.render_backend == "texture-software"))
+if texture_renderer:
+    # Never shown: the display surface only gives convert() and convert_alpha() their pixel format
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.HIDDEN)
+    screen = TextureCanvas(texture_renderer, (SCREEN_WIDTH, SCREEN_HEIGHT))
+elif RENDER_SIZE == (DESIGN_WIDTH, DESIGN_HEIGHT):
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+else:
+    # SDL upscales each presented frame on the GPU and maps mouse events back to render coordinates
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SCALED)
+    try:
+        # SCALED windows default to an integer multiple of the render size; open at the design size instead
+        from pygame._sdl2.video import Window
+        Window.from_display_module().size = (DESIGN_WIDTH, DESIGN_HEIGHT)
+    except (ImportError, AttributeError, pygame.error) as e:
+        print(f"Warning: Could not resize the scaled window ({e}); keeping SDL's choice.")
+    print(f"DEBUG: Rendering at {SCREEN_WIDTH}x{SCREEN_HEIGHT}, upscaled to {pygame.display.get_window_size()}.")
 pygame.display.set_caption("Lights Out! Bacteria Game")
 
-# --- Load Assets ---
-# Slide Images
-slide_images_paths = [
-    "1.png", "2.png", "3.png", "4.png", "8.png", "9.png",
-    "10.png", "11.png", "15.png", "16.png", "17.png", "24.png",
-    "25.png", "26.png"
-]
-slide_images = []
-for path in slide_images_paths:
+class DirtyRectRenderer:
+    # Repaints and presents only the parts of the screen that changed since the last frame.
+    # Every frame starts with begin_frame(scene_key, paint_background). If scene_key equals
+    # the previous frame's key the static background is unchanged, so it is only repainted
+    # (clipped) over the rects dirtied last frame; otherwise the whole background is painted
+    # and the frame is flipped in full. Everything drawn on top of the background must be
+    # reported through mark() so it can be pushed now and erased next frame.
+    def __init__(self, target, enabled):
+        self.target = target
+        self.enabled = enabled
+        self.screen_rect = target.get_rect()
+        self._scene_key = None
+        self._full_frame = True
+        self._rects = []
+        self._previous_rects = []
+
+    def begin_frame(self, scene_key, paint_background):
+        self._full_frame = not self.enabled or scene_key != self._scene_key
+        self._scene_key = scene_key
+        if self._full_frame:
+            paint_background()
+        else:
+            for rect in self._previous_rects:
+                self.target.set_clip(rect)
+                paint_background()
+            self.target.set_clip(None)
+        self._rects = []
+
+    def mark(self, rect):
+        if self.screen_rect.contains(rect): # Common case: keep the caller's rect, no clipping needed
+            self._rects.append(rect)
+            return rect
+        clipped = self.screen_rect.clip(rect)
+        if clipped.width and clipped.height:
+            self._rects.append(clipped)
+        return rect
+
+    def invalidate(self):
+        # Forces the next frame to repaint and flip everything (e.g. after the window was exposed)
+        self._scene_key = None
+
+    def present(self):
+        if self._full_frame:
+            pygame.display.flip()
+        else:
+            changed_rects = self._previous_rects + self._rects
+            if changed_rects:
+                pygame.display.update(changed_rects)
+        self._previous_rects = self._rects
+
+if texture_renderer:
+    renderer = TextureFrameRenderer(screen)
+else:
+    renderer = DirtyRectRenderer(screen, USE_DIRTY_RECT_RENDERING)
+
+# --- Asset Memory Registry ---
+class AssetMemoryRegistry:
+    # Tracks the long-lived Surfaces the app creates (decoded assets, placeholders, transform
+    # cache entries, classroom copies, HUD surfaces) by asset group, through weak references
+    # so tracking never keeps a surface alive. A surface without an explicit group belongs to
+    # the group() block active on the creating thread, e.g. the asset group whose loader made
+    # it. Derived surfaces keep their source's label, which shows how much memory goes to
+    # scaled and rotated copies next to each original.
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.peak_bytes = 0
+        self._entries = {} # id(surface) -> group, label, size, bit depth, bytes, source label, weakref
+        self._bytes = 0
+        self._over_budget = False
+        self._lock = threading.RLock() # Weakref callbacks can run inside track() when it triggers a collection
+        self._thread_state = threading.local()
+
+    @contextlib.contextmanager
+    def group(self, name):
+        previous = self.current_group()
+        self._thread_state.group = name
+        try:
+            yield
+        finally:
+            self._thread_state.group = previous
+
+    def current_group(self):
+        return getattr(self._thread_state, "group", "unassigned")
+
+    def track(self, surface, label=None, group=None, source=None):
+        # Returns surface, so creation sites can wrap their expression
+        if surface is None:
+            return surface
+        key = id(surface)
+        with self._lock:
+            if key in self._entries: # The same object handed out again
+                return surface
+            source_entry = self._entries.get(id(source)) if source is not None else None
+            source_label = source_entry["label"] if source_entry else None
+            entry = {"group": group or self.current_group(), "label": label or source_label or "unlabelled",
+                     "size": surface.get_size(), "bits": surface.get_bitsize(),
+                     "bytes": surface.get_pitch() * surface.get_height(), "source": source_label}
+            entry["ref"] = weakref.ref(surface, lambda ref, key=key: self._forget(key, ref))
+            self._entries[key] = entry
+            self._bytes += entry["bytes"]
+            self.peak_bytes = max(self.peak_bytes, self._bytes)
+            crossed_budget = self._bytes > self.budget_bytes and not self._over_budget
+            if crossed_budget:
+                self._over_budget = True
+            total_bytes = self._bytes
+        if crossed_budget:
+            print(f"Warning: Asset memory is {total_bytes / (1024 * 1024):.1f} MB, over the "
+                  f"{self.budget_bytes / (1024 * 1024):.0f} MB budget (after {entry['group']}: {entry['label']}).")
+        return surface
+
+    def group_bytes(self):
+        totals = {}
+        with self._lock:
+            for entry in self._entries.values():
+                totals[entry["group"]] = totals.get(entry["group"], 0) + entry["bytes"]
+        return totals
+
+    def report_lines(self):
+        megabyte = 1024 * 1024
+        with self._lock:
+            entries = list(self._entries.values())
+            total_bytes = self._bytes
+        rows_by_group = {} # group -> (label, source label) -> entries
+        for entry in entries:
+            rows_by_group.setdefault(entry["group"], {}).setdefault((entry["label"], entry["source"]), []).append(entry)
+        def bytes_of(rows):
+            return sum(entry["bytes"] for row in rows for entry in row)
+        lines = [f"Asset memory: {total_bytes / megabyte:.1f} MB in {len(entries)} surfaces "
+                 f"(peak {self.peak_bytes / megabyte:.1f} MB, budget {self.budget_bytes / megabyte:.0f} MB)"]
+        for group, rows in sorted(rows_by_group.items(), key=lambda item: -bytes_of(item[1].values())):
+            derived_bytes = bytes_of(row for (label, source), row in rows.items() if source)
+            lines.append(f"  {group:<18} {sum(len(row) for row in rows.values()):>4} surfaces {bytes_of(rows.values()) / megabyte:8.1f} MB"
+                         + (f" ({derived_bytes / megabyte:.1f} MB in derived copies)" if derived_bytes else ""))
+            for (label, source), row in sorted(rows.items(), key=lambda item: -bytes_of([item[1]])):
+                sizes = {entry["size"] for entry in row}
+                size_text = "x".join(map(str, next(iter(sizes)))) if len(sizes) == 1 else f"{len(sizes)} sizes"
+                bits_text = "/".join(str(bits) for bits in sorted({entry["bits"] for entry in row}))
+                lines.append(f"    {label:<36} {len(row):>4} x {size_text:<11} {bits_text:>5}-bit {bytes_of([row]) / megabyte:8.2f} MB"
+                             + (f"  (from {source})" if source else ""))
+        return lines
+
+    def _forget(self, key, ref):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["ref"] is not ref:
+                return
+            del self._entries[key]
+            self._bytes -= entry["bytes"]
+            if self._bytes <= self.budget_bytes:
+                self._over_budget = False # Warn again if it climbs back over
+
+asset_memory = AssetMemoryRegistry(int((cli_args.asset_memory_budget or ASSET_MEMORY_BUDGET_MB) * 1024 * 1024))
+
+def print_asset_memory_report():
+    for line in asset_memory.report_lines():
+        print(f"DEBUG: {line}")
+
+# --- Baked Asset Cache ---
+class BakedAssetCache:
+    # Keeps the final pixels of every image asset (after convert and scale) as raw BGRA files
+    # in cache_dir, which matches the layout of convert_alpha() surfaces on common 32-bit
+    # displays. Later launches memory-map those files and wrap them with
+    # pygame.image.frombuffer instead of decoding and scaling the PNGs again.
+    # manifest.json records each entry's size, pixel format and source hash. An entry is
+    # rebaked only when its source file's contents change; size and mtime are checked first,
+    # so unchanged files are not re-hashed.
+    MANIFEST_VERSION = 1
+    PIXEL_FORMAT = "BGRA"
+
+    def __init__(self, cache_dir, enabled):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.hits = 0
+        self.bakes = 0
+        self._display_alpha_masks = None # Pixel layout convert_alpha() produces on this display
+        self._manifest_write_failed = False
+        self._lock = threading.Lock()
+        self._entries = self._read_manifest() if enabled else {}
+
+    def load(self, path, size=None, alpha=True, smooth=False, scale=1.0):
+        if not self.enabled:
+            return self._decode(path, size, alpha, smooth, scale)
+        source_stat = os.stat(path)
+        key = f"{path}|{size[0]}x{size[1]}|{'alpha' if alpha else 'opaque'}|{'smooth' if smooth else 'scale'}" if size else \
+              f"{path}|native|{'alpha' if alpha else 'opaque'}" if scale == 1.0 else \
+              f"{path}|x{scale:g}|{'alpha' if alpha else 'opaque'}"
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and self._is_current(entry, path, source_stat):
+            surface = self._map(entry, alpha)
+            if surface is not None:
+                self.hits += 1
+                return surface
+        surface = self._decode(path, size, alpha, smooth, scale)
+        self._bake(key, path, source_stat, surface)
+        return surface
+
+    def stats_line(self):
+        return f"Baked asset cache: {self.hits} mapped, {self.bakes} baked"
+
+    def _decode(self, path, size, alpha, smooth, scale):
+        image = pygame.image.load(path)
+        image = image.convert_alpha() if alpha else image.convert()
+        if not size and scale != 1.0: # Native-size sprite drawn at a lower render resolution
+            size = (max(1, round(image.get_width() * scale)), max(1, round(image.get_height() * scale)))
+            smooth = True
+        if size and image.get_size() != tuple(size):
+            image = pygame.transform.smoothscale(image, size) if smooth else pygame.transform.scale(image, size)
+        return image
+
+    def _source_hash(self, path):
+        with open(path, "rb") as source_file:
+            return hashlib.sha1(source_file.read()).hexdigest()
+
+    def _is_current(self, entry, path, source_stat):
+        if entry["source_size"] == source_stat.st_size and entry["source_mtime_ns"] == source_stat.st_mtime_ns:
+            return True
+        if entry["source_hash"] != self._source_hash(path):
+            return False
+        with self._lock: # Touched but unchanged (e.g. a fresh checkout): remember the new mtime
+            entry["source_size"] = source_stat.st_size
+            entry["source_mtime_ns"] = source_stat.st_mtime_ns
+            if not self._manifest_write_failed:
+                try:
+                    self._write_manifest()
+                except OSError as e: # Read-only or full cache: the entry is still good, it is just re-hashed next launch
+                    print(f"Warning: Could not update baked asset cache manifest ({e}); unchanged sources will be re-hashed.")
+                    self._manifest_write_failed = True
+        return True
+
+    def _map(self, entry, alpha):
+        blob_path = os.path.join(self.cache_dir, entry["blob"])
+        width, height = entry["size"]
+        try:
+            with open(blob_path, "rb") as blob_file:
+                # ACCESS_COPY: pages are shared with the page cache but writes stay private
+                pixels = mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return None
+        if len(pixels) != width * height * 4 or entry["format"] != self.PIXEL_FORMAT:
+            return None
+        surface = pygame.image.frombuffer(pixels, (width, height), self.PIXEL_FORMAT)
+        if not alpha:
+            return surface.convert() # Opaque assets need a surface without per-pixel alpha (one copy)
+        if self._display_alpha_masks is None:
+            self._display_alpha_masks = pygame.Surface((1, 1)).convert_alpha().get_masks()
+        if surface.get_masks() != self._display_alpha_masks:
+            return surface.convert_alpha() # Display uses another layout: convert once
+        return surface # Zero-copy: the surface reads straight from the mapped file
+
+    def _bake(self, key, path, source_stat, surface):
+        blob_name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".bgra"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            blob_path = os.path.join(self.cache_dir, blob_name)
+            with open(blob_path + ".tmp", "wb") as blob_file:
+                blob_file.write(pygame.image.tobytes(surface, self.PIXEL_FORMAT))
+            os.replace(blob_path + ".tmp", blob_path)
+            with self._lock:
+                self._entries[key] = {
+                    "source": path,
+                    "source_hash": self._source_hash(path),
+                    "source_size": source_stat.st_size,
+                    "source_mtime_ns": source_stat.st_mtime_ns,
+                    "size": list(surface.get_size()),
+                    "format": self.PIXEL_FORMAT,
+                    "blob": blob_name,
+                }
+                self._write_manifest()
+            self.bakes += 1
+        except OSError as e:
+            print(f"Warning: Could not write baked asset cache ({e}); continuing without it.")
+            self.enabled = False
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != self.MANIFEST_VERSION:
+            return {}
+        return manifest.get("entries", {})
+
+    def _write_manifest(self):
+        # Called with self._lock held
+        with open(self.manifest_path + ".tmp", "w") as manifest_file:
+            json.dump({"version": self.MANIFEST_VERSION, "entries": self._entries}, manifest_file, indent=1)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+asset_cache = BakedAssetCache(ASSET_CACHE_DIR, ASSET_CACHE_ENABLED)
+
+def load_image(path, size=None, alpha=True, smooth=False, group=None):
+    # Every image asset goes through here: decoded, converted (convert_alpha or convert) and
+    # optionally scaled to size, or mapped from the baked cache when the source is unchanged.
+    # Without a size, sprites authored for the design resolution are scaled by RENDER_SCALE.
+    return asset_memory.track(asset_cache.load(path, size, alpha, smooth, RENDER_SCALE), path, group)
+
+def placeholder_surface(label, size, flags=0):
+    # Stand-in for an image that failed to load, counted in the asset memory report
+    return asset_memory.track(pygame.Surface(size, flags), label, "placeholders")
+
+# --- Slide Cache ---
+def make_placeholder_surface(path, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+    placeholder = placeholder_surface(path, size)
+    placeholder.fill(LIGHT_GRAY)
+    font = pygame.font.Font(None, render_length(72))
+    text_surf = font.render(f"Error: Could not load {path}", True, BLACK)
+    text_rect = text_surf.get_rect(center=(size[0] // 2, size[1] // 2))
+    placeholder.blit(text_surf, text_rect)
+    return placeholder
+
+def load_slide_surface(path):
     try:
-        image = pygame.image.load(path).convert_alpha()
-        image = pygame.transform.scale(image, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        slide_images.append(image)
-    except pygame.error as e:
+        return load_image(path, (SCREEN_WIDTH, SCREEN_HEIGHT), group="slides")
+    except (pygame.error, OSError) as e:
         print(f"Error loading slide image {path}: {e}")
-        placeholder = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        placeholder.fill(LIGHT_GRAY)
-        font = pygame.font.Font(None, 72)
-        text_surf = font.render(f"Error: Could not load {path}", True, BLACK)
-        text_rect = text_surf.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-        placeholder.blit(text_surf, text_rect)
-        slide_images.append(placeholder)
-
-if not slide_images or len(slide_images) != len(slide_images_paths):
-    print("Critical error: Not all slides loaded! Please check image paths and files.")
+        return make_placeholder_surface(path)
+
+class SlideCache:
+    # Indexable like the old list of slide surfaces, but decodes each image only when it is
+    # first needed and keeps the most recently used ones resident under budget_bytes.
+    # Whenever the current index changes, the indices in `neighbours` (the slides its buttons
+    # lead to) are queued for decoding on a background thread.
+    def __init__(self, paths, budget_bytes, loader=load_slide_surface, name="slides"):
+        self.paths = list(paths)
+        self.budget_bytes = budget_bytes
+        self.loader = loader
+        self.name = name
+        self.neighbours = {} # index -> list of indices worth prefetching from there
+        self._surfaces = OrderedDict() # index -> Surface, least recently used first
+        self._bytes = 0
+        self._pinned_index = None # Most recently requested index, never evicted
+        self._pending = {} # index -> threading.Event for decodes in flight
+        self._lock = threading.Lock()
+        self._prefetch_queue = queue.Queue()
+        self._prefetch_thread = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        return self.get(index)
+
+    def set_neighbours(self, neighbours):
+        self.neighbours = {index: list(targets) for index, targets in neighbours.items()}
+
+    def get(self, index):
+        if not 0 <= index < len(self.paths):
+            raise IndexError(f"{self.name} index {index} out of range")
+        index_changed = index != self._pinned_index
+        self._pinned_index = index
+        surface = self._get_or_decode(index)
+        if index_changed:
+            self.prefetch(self.neighbours.get(index, []))
+        return surface
+
+    def prefetch(self, indices):
+        if not SLIDE_PREFETCH_ENABLED:
+            return
+        for index in indices:
+            if 0 <= index < len(self.paths):
+                self._prefetch_queue.put(index)
+        if self._prefetch_thread is None:
+            self._prefetch_thread = threading.Thread(target=self._prefetch_worker, name=f"{self.name}-prefetch", daemon=True)
+            self._prefetch_thread.start()
+
+    def resident_bytes(self):
+        with self._lock:
+            return self._bytes
+
+    def _get_or_decode(self, index):
+        while True:
+            with self._lock:
+                surface = self._surfaces.get(index)
+                if surface is not None:
+                    self._surfaces.move_to_end(index)
+                    return surface
+                pending = self._pending.get(index)
+                if pending is None: # Nobody is decoding it, so this thread does
+                    pending = self._pending[index] = threading.Event()
+                    break
+            pending.wait() # Another thread is decoding it; re-check once it lands
+        try:
+            surface = self.loader(self.paths[index])
+            self._insert(index, surface)
+        finally:
+            with self._lock:
+                del self._pending[index]
+            pending.set()
+        return surface
+
+    def _insert(self, index, surface):
+        with self._lock:
+            self._surfaces[index] = surface
+            self._bytes += surface.get_pitch() * surface.get_height()
+            for victim in list(self._surfaces):
+                if self._bytes <= self.budget_bytes:
+                    break
+                if victim in (index, self._pinned_index):
+                    continue
+                evicted = self._surfaces.pop(victim)
+                self._bytes -= evicted.get_pitch() * evicted.get_height()
+
+    def _prefetch_worker(self):
+        while True:
+            index = self._prefetch_queue.get()
+            with self._lock:
+                already_available = index in self._surfaces or index in self._pending
+            if not already_available:
+                self._get_or_decode(index)
+
+# --- Sprite Transform Caches ---
+class TransformWorker:
+    # One background thread running the transforms that TransformedSpriteCache.prefetch()
+    # queues. Off by default: on a single core it competes with the main thread for the GIL
+    # between transforms, and only pays off where the transforms themselves are long
+    # (pygame releases the GIL inside rotate and smoothscale).
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, cache, key):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="transform-prefetch", daemon=True)
+            self._thread.start()
+        self._queue.put((cache, key))
+
+    def stop(self):
+        # Lets the transform in flight finish before pygame shuts down underneath it
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            cache, key = job
+            try:
+                cache.prepare(key)
+            except pygame.error as e:
+                print(f"Warning: Could not prepare {cache.name} [{key}] ahead of time ({e}).")
+
+transform_worker = TransformWorker(TRANSFORM_PREFETCH_ENABLED or cli_args.prefetch_transforms)
+
+class TransformedSpriteCache:
+    # LRU of surfaces derived from one source sprite, keyed by a quantized transform
+    # parameter and bounded by budget_bytes. Subclasses provide quantize() and transform().
+    # hits/misses let us see how many per-frame transforms the cache saves; prepared counts
+    # the entries transform_worker built ahead of time from prefetch() calls. A get() miss
+    # still transforms synchronously, so a wrong prediction only costs the worker's time.
+    # Only caches whose transform releases the GIL (prefetchable) are built ahead of time.
+    prefetchable = False
+
+    def __init__(self, source, budget_bytes, name):
+        self.source = source
+        self.budget_bytes = budget_bytes
+        self.name = name
+        self.group = asset_memory.current_group() # Cached surfaces count towards the group that built the cache
+        self.hits = 0
+        self.misses = 0
+        self.prepared = 0
+        self._surfaces = OrderedDict() # key -> Surface, least recently used first
+        self._bytes = 0
+        self._queued = set() # Keys waiting for (or being built by) transform_worker
+        self._lock = threading.Lock()
+
+    def quantize(self, value):
+        raise NotImplementedError
+
+    def transform(self, key):
+        raise NotImplementedError
+
+    def get(self, value):
+        key = self.quantize(value)
+        with self._lock:
+            surface = self._surfaces.get(key)
+            if surface is not None:
+                self.hits += 1
+                self._surfaces.move_to_end(key)
+                return surface
+            self.misses += 1
+        surface = self.transform(key)
+        with self._lock:
+            prepared_meanwhile = self._surfaces.get(key) # The worker may have been building the same key
+            return prepared_meanwhile if prepared_meanwhile is not None else self._store(key, surface)
+
+    def prefetch(self, value):
+        # Queues the transform for value on transform_worker unless it is cached or queued already
+        if not transform_worker.enabled or not self.prefetchable:
+            return
+        if self.source.get_width() * self.source.get_height() < TRANSFORM_PREFETCH_MIN_PIXELS:
+            return
+        key = self.quantize(value)
+        with self._lock:
+            if key in self._surfaces or key in self._queued:
+                return
+            self._queued.add(key)
+        transform_worker.submit(self, key)
+
+    def prepare(self, key):
+        # Runs on transform_worker
+        try:
+            with self._lock:
+                if key in self._surfaces:
+                    return
+            surface = self.transform(key)
+            with self._lock:
+                if key not in self._surfaces:
+                    self.prepared += 1
+                    self._store(key, surface)
+        finally:
+            with self._lock:
+                self._queued.discard(key)
+
+    def warm(self, keys):
+        # Builds keys in order until the next one would push the cache over budget, so
+        # warming never evicts what it built first. Returns how many keys are cached.
+        warmed = 0
+        for key in keys:
+            if key not in self._surfaces:
+                surface = self.transform(key)
+                with self._lock:
+                    if self._surfaces and self._bytes + surface.get_pitch() * surface.get_height() > self.budget_bytes:
+                        break
+                    self._store(key, surface)
+            warmed += 1
+        return warmed
+
+    def stats_line(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (f"{self.name}: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+                f"{self.prepared} prepared ahead, {len(self._surfaces)} surfaces, {self._bytes / (1024 * 1024):.1f} MB")
+
+    def _store(self, key, surface):
+        # Called with self._lock held
+        asset_memory.track(surface, self.name, self.group, source=self.source)
+        self._surfaces[key] = surface
+        self._bytes += surface.get_pitch() * surface.get_height()
+        while self._bytes > self.budget_bytes and len(self._surfaces) > 1:
+            _, evicted = self._surfaces.popitem(last=False)
+            self._bytes -= evicted.get_pitch() * evicted.get_height()
+        return surface
+
+class RotatedSpriteCache(TransformedSpriteCache):
+    # Keys are whole multiples of step_degrees, so get(angle) returns the source rotated
+    # by the nearest step.
+    prefetchable = True
+
+    def __init__(self, source, step_degrees, budget_bytes, name="rotations"):
+        super().__init__(source, budget_bytes, name)
+        self.step_degrees = step_degrees
+
+    def quantize(self, angle):
+        return round(angle / self.step_degrees)
+
+    def transform(self, key):
+        return pygame.transform.rotate(self.source, key * self.step_degrees)
+
+    def warm_range(self, start_angle, end_angle):
+        # Warms from start_angle towards end_angle, stopping where the budget runs out
+        start, end = self.quantize(start_angle), self.quantize(end_angle)
+        direction = 1 if end >= start else -1
+        return self.warm(range(start, end + direction, direction))
+
+class ScaledSpriteCache(TransformedSpriteCache):
+    # Keys are level indices 0..levels-1 spread linearly between min_scale and 1.0;
+    # get(ratio) maps a 0-1 ratio (e.g. health) to the nearest level.
+    prefetchable = True
+
+    def __init__(self, source, min_scale, levels, budget_bytes, name="scales"):
+        super().__init__(source, budget_bytes, name)
+        self.min_scale = min_scale
+        self.levels = levels
+
+    def quantize(self, ratio):
+        return round(max(0.0, min(1.0, ratio)) * (self.levels - 1))
+
+    def scale_for(self, key):
+        return self.min_scale + (1.0 - self.min_scale) * key / (self.levels - 1)
+
+    def transform(self, key):
+        current_scale = self.scale_for(key)
+        orig_w, orig_h = self.source.get_size()
+        scaled_size = (max(1, int(orig_w * current_scale)), max(1, int(orig_h * current_scale)))
+        return pygame.transform.smoothscale(self.source, scaled_size)
+
+class OsmoticBackgroundCache(TransformedSpriteCache):
+    # Opaque osmotic backgrounds: the health colour with the full-screen overlay (the source)
+    # already blended on top. Keys are whole multiples of hue_step_degrees, so get(hue)
+    # returns the background for the nearest step.
+    def __init__(self, overlay, hue_step_degrees, budget_bytes, name="osmotic backgrounds"):
+        super().__init__(overlay, budget_bytes, name)
+        self.hue_step_degrees = hue_step_degrees
+
+    def quantize(self, hue):
+        return round(hue / self.hue_step_degrees)
+
+    def transform(self, key):
+        background_color = pygame.Color(0); background_color.hsla = ((key * self.hue_step_degrees) % 360, 100, 50, 100)
+        layer = pygame.Surface(self.source.get_size()) # Already in the display's pixel format
+        layer.fill(background_color)
+        layer.blit(self.source, (0, 0))
+        return layer
+
+class EnzymeLayerCache(TransformedSpriteCache):
+    # Opaque enzyme backgrounds: the background image (the source) with one of the
+    # full-screen enzyme states blended on top at its rest position, keyed by state index.
+    def __init__(self, background, states, budget_bytes, name="enzyme layers"):
+        super().__init__(background, budget_bytes, name)
+        self.states = states
+
+    def quantize(self, state_index):
+        return state_index
+
+    def transform(self, key):
+        layer = self.source.copy() # The background is already convert()ed
+        layer.blit(self.states[key], (0, 0))
+        return layer
+
+# --- Sprite Atlas ---
+class TrimmedSprite:
+    # A sprite without its transparent borders: `area` of `surface` (a SpriteAtlas, or the
+    # sprite's own trimmed copy), placed `offset` into the sprite's box. Sized like the Surface
+    # it replaces (get_size, get_rect), so layout code is unchanged; clip_blit_item() turns
+    # it into a blit of `area`.
+    __slots__ = ("surface", "area", "offset", "size")
+
+    def __init__(self, surface, area, offset, size):
+        self.surface = surface
+        self.area = area
+        self.offset = offset
+        self.size = size
+
+    def get_size(self):
+        return self.size
+
+    def get_width(self):
+        return self.size[0]
+
+    def get_height(self):
+        return self.size[1]
+
+    def get_rect(self, **kwargs):
+        rect = pygame.Rect((0, 0), self.size)
+        for name, value in kwargs.items():
+            setattr(rect, name, value)
+        return rect
+
+    def scaled_image(self, scale):
+        # The whole sprite, borders restored, smoothscaled to scale (for classroom viewports)
+        image = pygame.Surface(self.size, pygame.SRCALPHA).convert_alpha()
+        image.fill((0, 0, 0, 0))
+        # MAX onto transparent black copies every channel exactly (a normal blit would blend)
+        image.blit(self.surface, self.offset, self.area, special_flags=pygame.BLEND_RGBA_MAX)
+        size = (max(1, round(self.size[0] * scale)), max(1, round(self.size[1] * scale)))
+        return pygame.transform.smoothscale(image, size)
+
+def trim_sprite(image, name):
+    # A TrimmedSprite on a copy of image's visible pixels, so blits skip the transparent border
+    bounds = image.get_bounding_rect()
+    surface = asset_memory.track(image.subsurface(bounds).copy(), name)
+    return TrimmedSprite(surface, surface.get_rect(), bounds.topleft, image.get_size())
+
+class SpriteAtlas:
+    # Small sprites packed into one surface, so a scene's sprite blits all read from the same
+    # pixels (and the texture backend uploads one texture). Each image is trimmed to its
+    # non-transparent bounding rect, then placed on shelves, tallest first. sprites maps the
+    # given names to TrimmedSprites.
+    def __init__(self, images, name="Sprite atlas", padding=SPRITE_ATLAS_PADDING):
+        trimmed = {sprite_name: image.get_bounding_rect() for sprite_name, image in images.items()}
+        order = sorted(images, key=lambda sprite_name: trimmed[sprite_name].height, reverse=True)
+        # Try every width that fits exactly n of the tallest sprites on the first shelf; keep the smallest atlas
+        widest = max(rect.width for rect in trimmed.values())
+        candidate_widths = {max(widest, sum(trimmed[sprite_name].width + padding for sprite_name in order[:n]) - padding)
+                            for n in range(1, len(order) + 1)}
+        atlas_width, placements, atlas_height = min(
+            ((width,) + self._shelf_pack(order, trimmed, width, padding) for width in candidate_widths),
+            key=lambda packing: packing[0] * packing[2])
+        surface = pygame.Surface((max(1, atlas_width), max(1, atlas_height)), pygame.SRCALPHA).convert_alpha()
+        surface.fill((0, 0, 0, 0))
+        for sprite_name, image in images.items():
+            # MAX onto transparent black copies every channel exactly (a normal blit would blend)
+            surface.blit(image, placements[sprite_name], trimmed[sprite_name], special_flags=pygame.BLEND_RGBA_MAX)
+        self.name = name
+        self.surface = asset_memory.track(surface, name, "sprite_atlas")
+        self.sprites = {sprite_name: TrimmedSprite(self.surface, placements[sprite_name], trimmed[sprite_name].topleft, image.get_size())
+                        for sprite_name, image in images.items()}
+
+    def __getitem__(self, sprite_name):
+        return self.sprites[sprite_name]
+
+    @staticmethod
+    def _shelf_pack(order, trimmed, width, padding):
+        # (placements, height) for packing the trimmed rects in order onto shelves `width` wide
+        placements = {}
+        x = y = shelf_height = 0
+        for sprite_name in order:
+            rect = trimmed[sprite_name]
+            if x and x + rect.width > width: # Start the next shelf
+                x, y, shelf_height = 0, y + shelf_height + padding, 0
+            placements[sprite_name] = pygame.Rect((x, y), rect.size)
+            x += rect.width + padding
+            shelf_height = max(shelf_height, rect.height)
+        return placements, y + shelf_height
+
+    def scaled(self, scale):
+        # Another atlas holding smoothscaled copies of every sprite, for classroom viewports
+        images = {sprite_name: sprite.scaled_image(scale) for sprite_name, sprite in self.sprites.items()}
+        return SpriteAtlas(images, f"{self.name} x{scale:g}")
+
+    def stats_line(self):
+        width, height = self.surface.get_size()
+        return (f"{self.name}: {len(self.sprites)} sprites in {width}x{height}, "
+                f"{self.surface.get_pitch() * height / (1024 * 1024):.1f} MB")
+
+# A game's asset group packs its set of small sprites into its own atlas as it loads (a scene only
+# draws its own game's sprites), so no game waits for another game's assets
+sprite_atlases = {} # Asset group name -> SpriteAtlas
+scaled_sprite_atlases = {} # (asset group name, classroom scale) -> SpriteAtlas of scaled copies
+scaled_trimmed_sprites = {} # (TrimmedSprite, classroom scale) -> TrimmedSprite of a scaled copy
+
+def pack_sprite_atlas(group_name, images):
+    # Called by a group's loader on its worker thread; returns the TrimmedSprites that replace
+    # the images, so the separate surfaces are released
+    atlas = sprite_atlases[group_name] = SpriteAtlas(images, f"Sprite atlas ({group_name})")
+    print(f"DEBUG: {atlas.stats_line()}")
+    return atlas.sprites
+
+def scaled_sprite_atlas(group_name, scale):
+    key = (group_name, scale)
+    if key not in scaled_sprite_atlases:
+        scaled_sprite_atlases[key] = sprite_atlases[group_name].scaled(scale)
+    return scaled_sprite_atlases[key]
+
+def scaled_trimmed_sprite(sprite, scale):
+    key = (sprite, scale)
+    if key not in scaled_trimmed_sprites:
+        scaled_trimmed_sprites[key] = trim_sprite(sprite.scaled_image(scale), f"Scaled copy x{scale:g}")
+    return scaled_trimmed_sprites[key]
+
+# --- Slide Graph ---
+class SlideGraph:
+    # The slides, their buttons and the games started from them, loaded from a declarative
+    # JSON file (see slide_graph.json) and compiled into per-slide lookup tables so clicks
+    # and key presses only look at what the current slide offers:
+    #   buttons_by_slide[i]  - buttons visible on slide i, rects in render coordinates
+    #   games_by_slide[i]    - {pygame key code: game type} that start a game from slide i
+    #   end_slide_by_game    - slide shown when each game ends
+    #   neighbours[i]        - slides reachable in one step (buttons and game endings)
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        with open(path) as graph_file:
+            data = json.load(graph_file)
+        if data.get("version") != self.VERSION:
+            raise ValueError(f"{path}: unsupported version {data.get('version')!r}")
+        self.slide_paths = list(data["slides"])
+        slide_count = len(self.slide_paths)
+        self.buttons = []
+        self.buttons_by_slide = [[] for _ in range(slide_count)]
+        self.games_by_slide = [{} for _ in range(slide_count)]
+        self.end_slide_by_game = {}
+        self.neighbours = {}
+
+        for button_spec in data.get("buttons", []):
+            # Rects are authored in design coordinates; clicks arrive in render coordinates
+            button_data = dict(button_spec, rect=render_rect(pygame.Rect(button_spec["rect"])))
+            if button_data.get("action") == "goto_slide":
+                self._check_slide(button_data["target_slide"], f"button '{button_data['id']}' target")
+            self.buttons.append(button_data)
+            for slide_index in button_data.get("visible_on_slides", []):
+                self._check_slide(slide_index, f"button '{button_data['id']}' slide")
+                self.buttons_by_slide[slide_index].append(button_data)
+                if button_data.get("action") == "goto_slide":
+                    self._add_edge(slide_index, button_data["target_slide"])
+
+        for game_spec in data.get("games", []):
+            game_type = game_spec["game"]
+            key_code = pygame.key.key_code(game_spec.get("start_key", "space"))
+            self.end_slide_by_game[game_type] = self._check_slide(game_spec["end_slide"], f"game '{game_type}' end slide")
+            for slide_index in game_spec["start_slides"]:
+                self._check_slide(slide_index, f"game '{game_type}' start slide")
+                self.games_by_slide[slide_index][key_code] = game_type
+                self._add_edge(slide_index, game_spec["end_slide"])
+
+    def __len__(self):
+        return len(self.slide_paths)
+
+    def hit_test(self, slide_index, pos):
+        for button_data in self.buttons_by_slide[slide_index]:
+            if button_data["rect"].collidepoint(pos):
+                return button_data
+        return None
+
+    def game_for_key(self, slide_index, key_code):
+        return self.games_by_slide[slide_index].get(key_code)
+
+    def games_started_from(self, slide_index):
+        return set(self.games_by_slide[slide_index].values())
+
+    def reachable_from(self, start_index=0):
+        reached, frontier = {start_index}, [start_index]
+        while frontier:
+            for target in self.neighbours.get(frontier.pop(), []):
+                if target not in reached:
+                    reached.add(target)
+                    frontier.append(target)
+        return reached
+
+    def describe(self):
+        # Plain-data view of the compiled graph for tooling (--dump-slide-graph)
+        reachable = self.reachable_from(0)
+        return {
+            "source": self.path,
+            "slides": [{"index": index, "image": path,
+                        "buttons": [button_data["id"] for button_data in self.buttons_by_slide[index]],
+                        "games": sorted(self.games_started_from(index)),
+                        "next": self.neighbours.get(index, [])}
+                       for index, path in enumerate(self.slide_paths)],
+            "game_end_slides": self.end_slide_by_game,
+            "unreachable_from_start": [index for index in range(len(self)) if index not in reachable],
+            "dead_ends": [index for index in range(len(self)) if not self.neighbours.get(index)],
+        }
+
+    def _check_slide(self, slide_index, what):
+        if not isinstance(slide_index, int) or not 0 <= slide_index < len(self.slide_paths):
+            raise ValueError(f"{self.path}: {what} {slide_index!r} is not a slide index (0-{len(self.slide_paths) - 1})")
+        return slide_index
+
+    def _add_edge(self, from_index, to_index):
+        targets = self.neighbours.setdefault(from_index, [])
+        if to_index not in targets:
+            targets.append(to_index)
+
+try:
+    slide_graph = SlideGraph(cli_args.slide_graph)
+except (OSError, ValueError, KeyError, TypeError) as e:
+    print(f"Critical error: Could not load slide graph '{cli_args.slide_graph}': {e!r}")
+    pygame.quit()
+    sys.exit()
+
+if cli_args.dump_slide_graph:
+    with open(cli_args.dump_slide_graph, "w") as dump_file:
+        json.dump(slide_graph.describe(), dump_file, indent=2)
+    print(f"DEBUG: Slide graph written to {cli_args.dump_slide_graph}")
+    pygame.quit()
+    sys.exit()
+
+# --- Load Assets ---
+# Slide Images
+slide_images_paths = slide_graph.slide_paths
+slide_images = SlideCache(slide_images_paths, SLIDE_CACHE_BUDGET_BYTES)
+
+if not slide_images:
+    print("Critical error: No slides configured! Please check image paths and files.")
     pygame.quit()
     sys.exit()
 
 # Fonts
-game_font_large = pygame.font.Font(None, 100)
-game_font_medium = pygame.font.Font(None, 60)
+game_font_large = pygame.font.Font(None, render_length(100))
+game_font_medium = pygame.font.Font(None, render_length(60))
 
-# Oxidative Stress Game Assets
+# Game asset groups are decoded and scaled on a worker pool (pygame releases the GIL while
+# decoding and smoothscaling) while the main loop already shows slide 0. Each loader assigns
+# its module globals; ensure_asset_group() blocks until a group is in before a game uses it.
 game_background_os_img = None
 scale_balance_img_orig = None
 bacteria_os_images = []
-try:
-    game_background_os_img = pygame.image.load("game_background_os.png").convert()
-    game_background_os_img = pygame.transform.scale(game_background_os_img, (SCREEN_WIDTH, SCREEN_HEIGHT))
-    scale_balance_img_orig = pygame.image.load("scale_balance.png").convert_alpha()
-
-    bacteria_os_images_paths = ["bacteria_os_100.png", "bacteria_os_75.png", "bacteria_os_50.png", "bacteria_os_25.png"]
-    bacteria_os_images = [pygame.image.load(p).convert_alpha() for p in bacteria_os_images_paths]
-except pygame.error as e:
-    print(f"Error loading Oxidative Stress game assets: {e}.")
-    if game_background_os_img is None:
-        game_background_os_img = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        game_background_os_img.fill(PURPLE_BACKGROUND)
-    if scale_balance_img_orig is None:
-        scale_balance_img_orig = pygame.Surface((300, 50), pygame.SRCALPHA); scale_balance_img_orig.fill(WHITE)
-    if not bacteria_os_images:
-        bacteria_os_images = [pygame.Surface((200, 200), pygame.SRCALPHA) for _ in range(4)]
-        for i, surf in enumerate(bacteria_os_images): surf.fill((0, 255, 0, 100))
-
-# Osmotic Shock Game Assets
+scale_balance_rotations = None
 bacteria_osmo_img_orig = None
 salt_particle_img = None
 tap_osmo_img = None
-try:
-    bacteria_osmo_img_orig = pygame.image.load("bacteria_osmo_orig.png").convert_alpha()
-    salt_particle_img = pygame.image.load("salt_particle.png").convert_alpha()
-    tap_osmo_img = pygame.image.load("tap_osmo.png").convert_alpha()
-    salt_particle_img = pygame.transform.smoothscale(salt_particle_img, (70, 70))
-except pygame.error as e:
-    print(f"Error loading Osmotic Shock game assets: {e}")
-    if bacteria_osmo_img_orig is None:
-        bacteria_osmo_img_orig = pygame.Surface((150, 150), pygame.SRCALPHA); bacteria_osmo_img_orig.fill((0,0,255,100))
-    if salt_particle_img is None:
-        salt_particle_img = pygame.Surface((20,20), pygame.SRCALPHA); salt_particle_img.fill(WHITE)
-    if tap_osmo_img is None:
-        tap_osmo_img = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        tap_osmo_img.fill((0,0,0,0)) # Fully transparent, assuming it's an overlay
-
-# Load Enzyme Inhibition Game Assets
+bacteria_osmo_scales = None
+osmotic_backgrounds = None
 background_enzyme_img = None # Initialize to None
-enzyme_state_images = [] # Initialize to empty list
+enzyme_layers = None
 inhibitor_triangle_img = None # Initialize to None
 inhibitor_original_w, inhibitor_original_h = 0, 0 # Initialize
 
-try:
-    background_enzyme_img = pygame.image.load("background_enzyme.png").convert()
-    background_enzyme_img = pygame.transform.scale(background_enzyme_img, (SCREEN_WIDTH, SCREEN_HEIGHT))
+# Oxidative Stress Game Assets
+def load_oxidative_stress_assets():
+    global game_background_os_img, scale_balance_img_orig, bacteria_os_images, scale_balance_rotations
+    try:
+        game_background_os_img = load_image("game_background_os.png", (SCREEN_WIDTH, SCREEN_HEIGHT), alpha=False)
+        scale_balance_img_orig = load_image("scale_balance.png")
+
+        bacteria_os_images_paths = ["bacteria_os_100.png", "bacteria_os_75.png", "bacteria_os_50.png", "bacteria_os_25.png"]
+        bacteria_os_images = [load_image(p) for p in bacteria_os_images_paths]
+    except (pygame.error, OSError) as e:
+        print(f"Error loading Oxidative Stress game assets: {e}.")
+        if game_background_os_img is None:
+            game_background_os_img = placeholder_surface("game_background_os.png", (SCREEN_WIDTH, SCREEN_HEIGHT))
+            game_background_os_img.fill(PURPLE_BACKGROUND)
+        if scale_balance_img_orig is None:
+            scale_balance_img_orig = placeholder_surface("scale_balance.png", render_size((300, 50)), pygame.SRCALPHA); scale_balance_img_orig.fill(WHITE)
+        if not bacteria_os_images:
+            bacteria_os_images = [placeholder_surface("bacteria_os_*.png", render_size((200, 200)), pygame.SRCALPHA) for _ in range(4)]
+            for i, surf in enumerate(bacteria_os_images): surf.fill((0, 255, 0, 100))
+    atlas_sprites = pack_sprite_atlas("oxidative_stress", {f"bacteria_os_{i}": image for i, image in enumerate(bacteria_os_images)})
+    bacteria_os_images = [atlas_sprites[f"bacteria_os_{i}"] for i in range(len(bacteria_os_images))]
+
+    # Rotated balances live for the whole session, so game restarts reuse them
+    scale_balance_rotations = RotatedSpriteCache(scale_balance_img_orig, SCALE_ROTATION_STEP_DEGREES,
+                                                 SCALE_ROTATION_CACHE_BUDGET_BYTES, name="Scale balance rotations")
+    if SCALE_ROTATION_CACHE_WARM:
+        # A game starts at full health (-MAX, see scale_balance_rotation), and damage tips the balance towards +MAX
+        warmed = scale_balance_rotations.warm_range(-MAX_SCALE_ROTATION_DEGREES, MAX_SCALE_ROTATION_DEGREES)
+        print(f"DEBUG: Warmed {warmed} scale balance rotations within the cache budget.")
 
-    enzyme_state_paths = ["enzyme_state1.png", "enzyme_state2.png", "enzyme_state3.png"]
-    for path in enzyme_state_paths:
-        img = pygame.image.load(path).convert_alpha()
-        enzyme_state_images.append(pygame.transform.scale(img, (SCREEN_WIDTH, SCREEN_HEIGHT)))
-    
-    inhibitor_triangle_img = pygame.image.load("inhibitor_triangle.png").convert_alpha()
-    inhibitor_original_w, inhibitor_original_h = inhibitor_triangle_img.get_size()
-
-except pygame.error as e:
-    print(f"Error loading Enzyme Inhibition game assets: {e}")
-    if background_enzyme_img is None:
-        background_enzyme_img = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)); background_enzyme_img.fill(PURPLE_BACKGROUND)
-    if not enzyme_state_images:
-        for _ in range(3):
-            surf = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            surf.fill((50, 50, 50, 100)); enzyme_state_images.append(surf)
-    if inhibitor_triangle_img is None:
-        inhibitor_triangle_img = pygame.Surface((50,50), pygame.SRCALPHA); inhibitor_triangle_img.fill(RED)
-        inhibitor_original_w, inhibitor_original_h = 50,50
+# Osmotic Shock Game Assets
+def load_osmotic_shock_assets():
+    global bacteria_osmo_img_orig, salt_particle_img, tap_osmo_img, bacteria_osmo_scales, osmotic_backgrounds
+    try:
+        bacteria_osmo_img_orig = load_image("bacteria_osmo_orig.png")
+        salt_particle_img = load_image("salt_particle.png", render_size((70, 70)), smooth=True)
+        tap_osmo_img = load_image("tap_osmo.png")
+    except (pygame.error, OSError) as e:
+        print(f"Error loading Osmotic Shock game assets: {e}")
+        if bacteria_osmo_img_orig is None:
+            bacteria_osmo_img_orig = placeholder_surface("bacteria_osmo_orig.png", render_size((150, 150)), pygame.SRCALPHA); bacteria_osmo_img_orig.fill((0,0,255,100))
+        if salt_particle_img is None:
+            salt_particle_img = placeholder_surface("salt_particle.png", render_size((20, 20)), pygame.SRCALPHA); salt_particle_img.fill(WHITE)
+        if tap_osmo_img is None:
+            tap_osmo_img = placeholder_surface("tap_osmo.png", (SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+            tap_osmo_img.fill((0,0,0,0)) # Fully transparent, assuming it's an overlay
+    salt_particle_img = trim_sprite(salt_particle_img, "salt_particle.png")
+
+    bacteria_osmo_scales = ScaledSpriteCache(bacteria_osmo_img_orig, MIN_BACTERIA_OSMO_SCALE, BACTERIA_OSMO_SCALE_LEVELS,
+                                             BACTERIA_OSMO_SCALE_CACHE_BUDGET_BYTES, name="Osmotic bacteria scales")
+    osmotic_backgrounds = OsmoticBackgroundCache(tap_osmo_img, OSMOTIC_HUE_STEP_DEGREES, OSMOTIC_LAYER_CACHE_BUDGET_BYTES,
+                                                 name="Osmotic backgrounds")
+
+# Load Enzyme Inhibition Game Assets
+def load_enzyme_state_surface(path):
+    try:
+        return load_image(path, (SCREEN_WIDTH, SCREEN_HEIGHT), group="enzyme_states")
+    except (pygame.error, OSError) as e:
+        print(f"Error loading enzyme state image {path}: {e}")
+        surf = placeholder_surface(path, (SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        surf.fill((50, 50, 50, 100))
+        return surf
+
+# Full-screen enzyme states are decoded lazily (prefetched when an enzyme info slide is shown)
+enzyme_state_paths = ["enzyme_state1.png", "enzyme_state2.png", "enzyme_state3.png"]
+enzyme_state_images = SlideCache(enzyme_state_paths, ENZYME_STATE_CACHE_BUDGET_BYTES,
+                                 loader=load_enzyme_state_surface, name="enzyme_states")
+
+def load_enzyme_inhibition_assets():
+    global background_enzyme_img, inhibitor_triangle_img, inhibitor_original_w, inhibitor_original_h, enzyme_layers
+    try:
+        background_enzyme_img = load_image("background_enzyme.png", (SCREEN_WIDTH, SCREEN_HEIGHT), alpha=False)
+
+        inhibitor_triangle_img = load_image("inhibitor_triangle.png")
+        inhibitor_original_w, inhibitor_original_h = inhibitor_triangle_img.get_size()
+
+    except (pygame.error, OSError) as e:
+        print(f"Error loading Enzyme Inhibition game assets: {e}")
+        if background_enzyme_img is None:
+            background_enzyme_img = placeholder_surface("background_enzyme.png", (SCREEN_WIDTH, SCREEN_HEIGHT)); background_enzyme_img.fill(PURPLE_BACKGROUND)
+        if inhibitor_triangle_img is None:
+            inhibitor_triangle_img = placeholder_surface("inhibitor_triangle.png", render_size((50, 50)), pygame.SRCALPHA); inhibitor_triangle_img.fill(RED)
+            inhibitor_original_w, inhibitor_original_h = inhibitor_triangle_img.get_size()
+    inhibitor_triangle_img = trim_sprite(inhibitor_triangle_img, "inhibitor_triangle.png")
+
+    enzyme_layers = EnzymeLayerCache(background_enzyme_img, enzyme_state_images, ENZYME_LAYER_CACHE_BUDGET_BYTES, name="Enzyme layers")
 
 # --- Start Background Music ---
-if background_music_loaded_successfully:
+def load_background_music():
+    global background_music_loaded_successfully
+    background_music_loaded_successfully = False # Flag to track if music loaded
     try:
-        pygame.mixer.music.set_volume(0.1)  # Adjust initial volume (0.0 to 1.0)
-        pygame.mixer.music.play(-1)         # Play indefinitely (loop)
-        print("DEBUG: Attempting to play background music.")
-        if pygame.mixer.music.get_busy():
-            print("DEBUG: Background music is now playing.")
-        else:
-            # This might happen if the volume is 0, or the file is valid but silent, or another issue.
-            print("DEBUG: Background music was started but pygame.mixer.music.get_busy() is False.")
+        pygame.mixer.music.load("background_music.mp3")
+        background_music_loaded_successfully = True
+        print("DEBUG: Background music 'background_music.mp3' loaded successfully.")
     except pygame.error as e:
-        print(f"Error playing background music: {e}")
-else:
-    print("DEBUG: Background music was not loaded, so not attempting to play.")
-
+        print(f"Warning: Could not load background music 'background_music.mp3' - {e}")
+        print("DEBUG: Background music loading failed.")
+
+    if background_music_loaded_successfully:
+        try:
+            pygame.mixer.music.set_volume(0.1)  # Adjust initial volume (0.0 to 1.0)
+            pygame.mixer.music.play(-1)         # Play indefinitely (loop)
+            print("DEBUG: Attempting to play background music.")
+            if pygame.mixer.music.get_busy():
+                print("DEBUG: Background music is now playing.")
+            else:
+                # This might happen if the volume is 0, or the file is valid but silent, or another issue.
+                print("DEBUG: Background music was started but pygame.mixer.music.get_busy() is False.")
+        except pygame.error as e:
+            print(f"Error playing background music: {e}")
+    else:
+        print("DEBUG: Background music was not loaded, so not attempting to play.")
+
+def timed_asset_group(name, loader):
+    load_start = time.perf_counter()
+    with asset_memory.group(name):
+        loader()
+    print(f"DEBUG: Asset group '{name}' loaded in {(time.perf_counter() - load_start) * 1000:.1f} ms "
+          f"on {threading.current_thread().name}.")
+
+ASSET_GROUP_LOADERS = {
+    "oxidative_stress": load_oxidative_stress_assets,
+    "osmotic_shock": load_osmotic_shock_assets,
+    "enzyme_inhibition": load_enzyme_inhibition_assets,
+    "music": load_background_music,
+}
+asset_loader_pool = concurrent.futures.ThreadPoolExecutor(max_workers=ASSET_LOADER_WORKERS, thread_name_prefix="asset-loader")
+asset_group_futures = {name: asset_loader_pool.submit(timed_asset_group, name, loader)
+                       for name, loader in ASSET_GROUP_LOADERS.items()}
+asset_loader_pool.shutdown(wait=False) # Workers exit once every group is in
+
+def ensure_asset_group(name):
+    # Blocks until the group's loader has finished; a loader exception is re-raised here
+    future = asset_group_futures[name]
+    if future.done():
+        return future.result()
+    wait_start = time.perf_counter()
+    result = future.result()
+    print(f"DEBUG: Waited {(time.perf_counter() - wait_start) * 1000:.1f} ms for asset group '{name}'.")
+    return result
+
+if cli_args.bake_assets:
+    # Bake the game groups and the lazily decoded slides and states
+    for group_name in asset_group_futures:
+        ensure_asset_group(group_name)
+    for path in slide_images_paths:
+        load_slide_surface(path)
+    for path in enzyme_state_paths:
+        load_enzyme_state_surface(path)
+    print(f"DEBUG: {asset_cache.stats_line()}")
+    pygame.quit()
+    sys.exit()
 
 # --- Game State Variables ---
 current_slide_index = 0
 total_slides = len(slide_images)
 current_mode = "slideshow"
 active_game_type = None
-health = HEALTH_MAX
-tap_button_flash_timer = 0
-salt_particles = []
 
 # Positions for Oxidative Stress game elements
-BACTERIA_POS_OS = (340, 700)
-SCALE_POS_OS = (1330, 870)
-HEALTH_BAR_POS_OS = (SCREEN_WIDTH // 2 + 500, SCREEN_HEIGHT * 0.30 + 20)
-HEALTH_BAR_SIZE_OS = (400, 40)
+BACTERIA_POS_OS = render_point((340, 700))
+SCALE_POS_OS = render_point((1330, 870))
+HEALTH_BAR_POS_OS = render_point((DESIGN_WIDTH // 2 + 500, DESIGN_HEIGHT * 0.30 + 20))
+HEALTH_BAR_SIZE_OS = render_size((400, 40))
 
 # Positions for Osmotic Shock game elements
 BACTERIA_OSMO_CENTER_POS = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
@@ -235,176 +1629,692 @@ SALT_X_POSITIONS = [
     SCREEN_WIDTH * 0.75, SCREEN_WIDTH * 0.8, SCREEN_WIDTH * 0.85, SCREEN_WIDTH * 0.9
 ]
 
-# --- Button Definitions (for slideshow) ---
-buttons = [
-    {"id": "start_button", "rect": pygame.Rect(680, 780, 560, 180), "action": "goto_slide", "target_slide": 1, "visible_on_slides": [0]},
-    {"id": "ready_button", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 2, "visible_on_slides": [1]},
-    {"id": "choose_method_1", "rect": pygame.Rect(160, 400, 460, 460), "action": "goto_slide", "target_slide": 3, "visible_on_slides": [2]},
-    {"id": "choose_method_2", "rect": pygame.Rect(730, 400, 460, 460), "action": "goto_slide", "target_slide": 6, "visible_on_slides": [2]},
-    {"id": "choose_method_3", "rect": pygame.Rect(1330, 400, 460, 460), "action": "goto_slide", "target_slide": 10, "visible_on_slides": [2]},
-    {"id": "finish_button", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 13, "visible_on_slides": [2]}, # Assuming slide 2 is the "choose method" slide
-    {"id": "tap_button_os_info", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 4, "visible_on_slides": [3]},
-    {"id": "next_after_boom_button_os", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 5, "visible_on_slides": [4]},
-    {"id": "back_to_choose_button_os", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 2, "visible_on_slides": [5]},
-    {"id": "tap_button_enzyme_info1", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 7, "visible_on_slides": [6]},
-    {"id": "tap_button_enzyme_info2", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 8, "visible_on_slides": [7]},
-    {"id": "next_after_boom_button_enzyme", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 9, "visible_on_slides": [8]},
-    {"id": "back_to_choose_button_enzyme", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 2, "visible_on_slides": [9]},
-    {"id": "tap_button_osmotic_info", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 11, "visible_on_slides": [10]},
-    {"id": "next_after_boom_button_osmotic", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 12, "visible_on_slides": [11]},
-    {"id": "back_to_choose_button_osmotic", "rect": pygame.Rect(800, 920, 320, 120), "action": "goto_slide", "target_slide": 2, "visible_on_slides": [12]},
-    {"id": "start_over_button_end", "rect": pygame.Rect(680, 780, 560, 180), "action": "goto_slide", "target_slide": 0, "visible_on_slides": [13]}
-]
+# --- Slideshow Navigation ---
+# Buttons, game triggers and slide order come from slide_graph; the slide cache prefetches
+# the slides reachable from the current one in the background
+slide_images.set_neighbours(slide_graph.neighbours)
+
+# Lazily decoded assets worth fetching as soon as a slide that starts the game is shown
+GAME_ASSET_PREFETCH = {
+    "enzyme_inhibition": lambda: enzyme_state_images.prefetch(range(len(enzyme_state_images))),
+}
+
+# --- Input Recording and Replay ---
+INPUT_LOG_VERSION = 1
+
+def encode_input_event(event):
+    # Only the events the main loop acts on are logged, with just the fields it reads
+    if event.type == pygame.KEYDOWN:
+        return ["k", event.key]
+    if event.type == pygame.MOUSEBUTTONDOWN:
+        return ["m", event.pos[0], event.pos[1], event.button]
+    if event.type in (pygame.QUIT, pygame.WINDOWCLOSE):
+        return ["q"]
+    return None
+
+def decode_input_event(encoded):
+    if encoded[0] == "k":
+        return pygame.event.Event(pygame.KEYDOWN, key=encoded[1], mod=0, unicode="")
+    if encoded[0] == "m":
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(encoded[1], encoded[2]), button=encoded[3])
+    return pygame.event.Event(pygame.QUIT)
+
+class InputRecorder:
+    # Writes a compact JSON-lines log of the session: a header with the random seed and the
+    # layout it was recorded with, then one line per frame that had input or read the
+    # simulation clock:
+    #   {"f": frame, "w": ms since recording started, "e": [events], "t": [clock reads]}
+    # "t" holds the exact perf_counter values the simulation saw, so a replay ticks the
+    # games exactly as the recorded session did.
+    def __init__(self, path, seed):
+        self.path = path
+        self.frames_written = 0
+        self._file = open(path, "w")
+        self._start_time = self._frame_start_time = time.perf_counter()
+        self._events = []
+        self._clock_reads = []
+        header = {"version": INPUT_LOG_VERSION, "seed": seed, "render_size": [SCREEN_WIDTH, SCREEN_HEIGHT],
+                  "slide_graph": cli_args.slide_graph, "sim_tick_rate": SIM_TICK_RATE, "players": cli_args.players}
+        self._file.write(json.dumps(header) + "\n")
+
+    def begin_frame(self):
+        self._frame_start_time = time.perf_counter()
+
+    def capture_events(self, events):
+        for event in events:
+            encoded = encode_input_event(event)
+            if encoded:
+                self._events.append(encoded)
+
+    def clock_read(self, now):
+        self._clock_reads.append(now)
+
+    def end_frame(self, frame_index):
+        if not self._events and not self._clock_reads:
+            return
+        line = {"f": frame_index, "w": round((self._frame_start_time - self._start_time) * 1000)}
+        if self._events:
+            line["e"] = self._events
+        if self._clock_reads:
+            line["t"] = self._clock_reads
+        self._file.write(json.dumps(line, separators=(",", ":")) + "\n")
+        self._events, self._clock_reads = [], []
+        self.frames_written += 1
+
+    def close(self):
+        self._file.close()
+        print(f"DEBUG: Recorded {self.frames_written} frames of input to {self.path}")
+
+class InputReplay:
+    # Plays back a log written by InputRecorder: begin_frame() selects the frame's line,
+    # events_for() returns its input and clock_read() hands out its clock reads in order.
+    # With realtime set, begin_frame() sleeps until the frame's recorded time.
+    def __init__(self, path, realtime):
+        self.path = path
+        self.realtime = realtime
+        with open(path) as log_file:
+            self.header = json.loads(log_file.readline())
+            if self.header.get("version") != INPUT_LOG_VERSION:
+                raise ValueError(f"{path}: unsupported input log version {self.header.get('version')!r}")
+            self._frames = {}
+            for line in log_file:
+                if line.strip():
+                    frame_line = json.loads(line)
+                    self._frames[frame_line["f"]] = frame_line
+        self.seed = self.header.get("seed")
+        self.last_frame = max(self._frames, default=0)
+        self.diverged = False
+        self._start_time = time.perf_counter()
+        self._frame_index = 0
+        self._clock_reads = list(self._frames.get(0, {}).get("t", [])) # Reads made before the first frame belong to it
+        if list(self.header.get("render_size", [])) != [SCREEN_WIDTH, SCREEN_HEIGHT]:
+            print(f"Warning: {path} was recorded at {self.header.get('render_size')}, replaying at "
+                  f"{SCREEN_WIDTH}x{SCREEN_HEIGHT}; clicks may miss.")
+
+    def begin_frame(self, frame_index):
+        if frame_index == self._frame_index:
+            return
+        self._frame_index = frame_index
+        frame_line = self._frames.get(frame_index, {})
+        self._clock_reads = list(frame_line.get("t", []))
+        if self.realtime and "w" in frame_line:
+            delay = self._start_time + frame_line["w"] / 1000.0 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def events_for(self, frame_index):
+        return [decode_input_event(encoded) for encoded in self._frames.get(frame_index, {}).get("e", [])]
+
+    def clock_read(self):
+        if self._clock_reads:
+            return self._clock_reads.pop(0)
+        if not self.diverged:
+            self.diverged = True
+            print(f"Warning: Replay of {self.path} diverged at frame {self._frame_index} (no recorded clock read left).")
+        return time.perf_counter()
+
+    def finished(self, frame_index):
+        return frame_index >= self.last_frame
+
+input_recorder = None
+input_replay = None
+random_seed = cli_args.seed
+try:
+    if cli_args.replay_input:
+        input_replay = InputReplay(cli_args.replay_input, cli_args.replay_realtime)
+        random_seed = input_replay.seed
+except (OSError, ValueError, KeyError) as e:
+    print(f"Critical error: Could not load input log '{cli_args.replay_input}': {e!r}")
+    pygame.quit()
+    sys.exit()
+if cli_args.record_input:
+    if random_seed is None:
+        random_seed = random.randrange(2 ** 32)
+    input_recorder = InputRecorder(cli_args.record_input, random_seed)
+if random_seed is not None:
+    random.seed(random_seed)
+    print(f"DEBUG: Random seed {random_seed}")
+
+def session_clock():
+    # The game simulation's time source: perf_counter, logged while recording and read back
+    # from the log while replaying
+    if input_replay:
+        return input_replay.clock_read()
+    now = time.perf_counter()
+    if input_recorder:
+        input_recorder.clock_read(now)
+    return now
+
+# --- Salt Particle System ---
+class SaltParticleSystem:
+    # Positions and velocities of the osmotic salt particles, kept as numpy arrays when numpy
+    # is available (plain lists otherwise) so updates and wrap-around are done for all
+    # particles at once. draw() submits every visible particle in one Surface.blits call.
+    def __init__(self, image, count, x_positions, speed):
+        self.image = image
+        self.count = count
+        self.x_positions = x_positions
+        self.speed = speed
+        self.height = image.get_height() if image else 0
+        self.active = 0
+        self.x = self.y = self.previous_y = self.vy = []
+
+    def set_image(self, image):
+        # The particle sprite arrives from the asset loader pool after the system is built
+        self.image = image
+        self.height = image.get_height() if image else 0
+
+    def reset(self, active):
+        # Columns come from x_positions first, then random ones; random.* keeps seeded runs reproducible
+        self.active = self.count if active and self.image else 0
+        xs = [self.x_positions[i] if i < len(self.x_positions) else random.uniform(0, SCREEN_WIDTH - self.image.get_width())
+              for i in range(self.active)]
+        ys = [random.randint(0, SCREEN_HEIGHT - self.height) for _ in range(self.active)]
+        vys = [random.choice([-self.speed, self.speed]) for _ in range(self.active)]
+        if numpy is not None:
+            self.x = numpy.array(xs, dtype=numpy.int32)
+            self.y = numpy.array(ys, dtype=numpy.float64)
+            self.vy = numpy.array(vys, dtype=numpy.float64)
+            self.previous_y = self.y.copy()
+        else:
+            self.x, self.y, self.vy, self.previous_y = [int(x) for x in xs], ys, vys, list(ys)
+
+    def tick(self):
+        if not self.active:
+            return
+        top, bottom = -self.height, SCREEN_HEIGHT
+        if numpy is not None:
+            self.previous_y[:] = self.y
+            self.y += self.vy
+            self.y[self.y < top] = bottom # Particle fully off screen top: reappear at bottom
+            self.y[self.y > bottom] = top # Particle fully off screen bottom: reappear at top
+        else:
+            self.previous_y[:] = self.y
+            for i in range(self.active):
+                y = self.y[i] + self.vy[i]
+                if y < top: y = bottom
+                elif y > bottom: y = top
+                self.y[i] = y
+
+    def display_y(self, count, alpha):
+        # Interpolated between the last two ticks, except for particles that just wrapped
+        if numpy is not None:
+            y, previous_y = self.y[:count], self.previous_y[:count]
+            wrapped = numpy.abs(y - previous_y) > self.speed
+            return numpy.where(wrapped, y, previous_y + (y - previous_y) * alpha).astype(numpy.int32)
+        return [int(y if abs(y - py) > self.speed else py + (y - py) * alpha)
+                for y, py in zip(self.y[:count], self.previous_y[:count])]
+
+    def draw(self, target, count, alpha, image=None, scale=1.0, offset=(0, 0)):
+        # Returns the rects that changed on screen. A scaled-down viewport passes its own
+        # (already scaled) image plus the scale and offset to map full-screen positions.
+        count = min(count, self.active)
+        if count <= 0:
+            return []
+        xs = self.x[:count]
+        ys = self.display_y(count, alpha)
+        if scale != 1.0 or offset != (0, 0):
+            if numpy is not None:
+                xs = offset[0] + (xs * scale).astype(numpy.int32)
+                ys = offset[1] + (ys * scale).astype(numpy.int32)
+            else:
+                xs = [offset[0] + int(x * scale) for x in xs]
+                ys = [offset[1] + int(y * scale) for y in ys]
+        return target.blit_positions(image or self.image, xs, ys, SALT_PARTICLE_DIRTY_RECT_LIMIT)
+
+# --- Game Simulation ---
+class GameSimulation:
+    # Health, regeneration, salt particles and the tap flash of the running game. State only
+    # changes in tick(), which the main loop calls at SIM_TICK_RATE using an accumulator, so
+    # the difficulty is the same whatever the render rate. The previous tick's values are
+    # kept so frames drawn between ticks can interpolate.
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.salt_particles = SaltParticleSystem(salt_particle_img, NUM_SALT_PARTICLES, SALT_X_POSITIONS, SALT_PARTICLE_SPEED_Y)
+        self.reset()
+
+    def reset(self, with_salt_particles=False, now=None):
+        self.health = HEALTH_MAX
+        self.previous_health = HEALTH_MAX
+        self.tick_count = 0
+        self.flash_end_tick = -1 # Last tick on which the tap flash is visible
+        self.accumulator = 0.0
+        self.last_advance_time = self.clock() if now is None else now # Shared start time keeps players' ticks in step
+        self.salt_particles.reset(with_salt_particles)
+
+    def advance(self, now):
+        # Adds the real time since the last call and returns how many ticks are now due
+        self.accumulator += now - self.last_advance_time
+        self.last_advance_time = now
+        due_ticks = int(self.accumulator / SIM_TICK_SECONDS)
+        if due_ticks > MAX_SIM_TICKS_PER_FRAME:
+            due_ticks = MAX_SIM_TICKS_PER_FRAME
+            self.accumulator = due_ticks * SIM_TICK_SECONDS
+        return due_ticks
+
+    def tick(self):
+        self.accumulator -= SIM_TICK_SECONDS
+        self.tick_count += 1
+        self.previous_health = self.health
+        if self.health < HEALTH_MAX and self.health > HEALTH_MIN:
+            self.health = min(self.health + REGEN_RATE, HEALTH_MAX)
+
+        self.salt_particles.tick()
+
+    def tap(self):
+        # Taps land immediately (no interpolation) so the hit shows on the very next frame
+        self.health = max(self.health - DAMAGE_PER_TAP, HEALTH_MIN)
+        self.previous_health = max(self.previous_health - DAMAGE_PER_TAP, HEALTH_MIN)
+        self.flash_end_tick = self.tick_count + FLASH_DURATION_FRAMES
+
+    def interpolation_alpha(self):
+        return max(0.0, min(1.0, self.accumulator / SIM_TICK_SECONDS))
+
+    def display_health(self):
+        alpha = self.interpolation_alpha()
+        return self.previous_health + (self.health - self.previous_health) * alpha
+
+    def flash_visible(self):
+        return self.tick_count <= self.flash_end_tick
+
+# --- HUD ---
+def health_bar_color(health_ratio):
+    # Smooth color transition for health bar
+    if health_ratio > 0.5: # Green to Yellow (100% to 50%)
+        g = 255
+        r = int(255 * (1 - (health_ratio - 0.5) * 2))
+    else: # Yellow to Red (50% to 0%)
+        r = 255
+        g = int(255 * (health_ratio * 2))
+    return (max(0, min(255, r)), max(0, min(255, g)), 0)
+
+class HudResources:
+    # Everything the game HUDs draw, built once per scale: the 101 "N%" labels, the bar colour
+    # lookup table and the tap flash surface. Drawing from these allocates no surfaces or strings.
+    def __init__(self, font, flash_size=TAP_BUTTON_VISUAL_RECT.size):
+        self.labels = [asset_memory.track(font.render(f"{percent}%", True, WHITE), "Health labels", "hud") for percent in range(101)]
+        self.bar_colors = [health_bar_color(i / (HEALTH_BAR_COLOR_LEVELS - 1)) for i in range(HEALTH_BAR_COLOR_LEVELS)]
+        if texture_renderer: # An opaque white texture; the renderer applies the flash's alpha as it draws
+            flash_texture_surface = asset_memory.track(pygame.Surface(flash_size), "Tap flash", "hud")
+            flash_texture_surface.fill(FLASH_COLOR[:3])
+            self.flash_surface = TextureSprite(flash_texture_surface, flash_size, alpha=FLASH_COLOR[3])
+        else:
+            self.flash_surface = asset_memory.track(pygame.Surface(flash_size, pygame.SRCALPHA), "Tap flash", "hud")
+            self.flash_surface.fill(FLASH_COLOR)
+
+    def label_index(self, health):
+        return max(0, min(100, int(health)))
+
+    def bar_color(self, health_ratio):
+        return self.bar_colors[int(max(0.0, min(1.0, health_ratio)) * (HEALTH_BAR_COLOR_LEVELS - 1))]
+
+    def draw_flash(self, target, flash_rect):
+        target.blit(self.flash_surface, flash_rect)
+        return flash_rect
+
+class HealthBarHud:
+    # One health bar with its percentage label to the left. Frame, fill and label rects are
+    # created up front (the fill rect's width is updated in place) and returned from draw()
+    # so the renderer can mark them without new Rect objects.
+    def __init__(self, resources, bar_pos, bar_size, scale=1.0):
+        self.resources = resources
+        self.bar_size = bar_size
+        border = max(1, round(render_length(2) * scale))
+        self.frame_rect = pygame.Rect(bar_pos[0] - border, bar_pos[1] - border, bar_size[0] + 2 * border, bar_size[1] + 2 * border)
+        self.fill_rect = pygame.Rect(bar_pos[0], bar_pos[1], 0, bar_size[1])
+        label_anchor = (bar_pos[0] - round(render_length(30) * scale), bar_pos[1] + bar_size[1] // 2)
+        self.label_rects = [label.get_rect(midright=label_anchor) for label in resources.labels]
+
+    def draw(self, target, health):
+        health_ratio = max(0, health / HEALTH_MAX)
+        self.fill_rect.width = int(self.bar_size[0] * health_ratio)
+        target.fill(BLACK, self.frame_rect)
+        target.fill(self.resources.bar_color(health_ratio), self.fill_rect)
+        label_index = self.resources.label_index(health)
+        label_rect = self.label_rects[label_index]
+        target.blit(self.resources.labels[label_index], label_rect)
+        return self.frame_rect, label_rect
+
+hud_resources = HudResources(game_font_large)
+scaled_hud_resources = {} # Classroom scale -> HudResources shared by every viewport drawn at that scale
+
+# --- Viewports and Players ---
+def clip_blit_item(source, dest, clip_rect):
+    # (visible rect, Surface.blits item) for drawing source at dest without leaving clip_rect;
+    # the item carries an area only when the sprite is partly outside or trimmed
+    if isinstance(source, TrimmedSprite):
+        dest_rect = pygame.Rect(dest[0], dest[1], *source.area.size).move(source.offset)
+        visible = dest_rect.clip(clip_rect)
+        return visible, (source.surface, visible.topleft, visible.move(source.area.x - dest_rect.x, source.area.y - dest_rect.y))
+    dest_rect = pygame.Rect(dest[0], dest[1], *source.get_size()) # Truncates float dests like Surface.blit
+    visible = dest_rect.clip(clip_rect)
+    if visible == dest_rect:
+        return visible, (source, dest_rect.topleft)
+    return visible, (source, visible.topleft, visible.move(-dest_rect.x, -dest_rect.y))
+
+class BlitBatch:
+    # Stands in for the screen while the game scenes draw their sprites: blit(), blits() and
+    # fill() return the rect they will touch (clipped to clip_rect, so viewports never draw
+    # into each other) and only record the operation. flush() replays everything in order,
+    # sending each run of consecutive blits through a single Surface.blits call.
+    def __init__(self, clip_rect):
+        self.clip_rect = clip_rect
+        self._ops = [] # ("blit", [blits items]) or ("fill", color, rect)
+
+    def blit(self, source, dest):
+        visible, item = clip_blit_item(source, dest, self.clip_rect)
+        if not visible.width or not visible.height:
+            return visible
+        self._add_blit_items([item])
+        return visible
+
+    def blits(self, blit_sequence):
+        return [self.blit(source, dest) for source, dest in blit_sequence]
+
+    def blit_positions(self, source, xs, ys, rect_limit):
+        # blits() for one source at many positions (numpy arrays or lists) without a Rect or a
+        # clip_blit_item() call per sprite: with numpy, sprites wholly inside clip_rect become
+        # blits items in bulk and those crossing its edge get their area clipped as arrays.
+        # Returns one visible rect per sprite, or their bounding rect beyond rect_limit sprites.
+        if isinstance(source, TrimmedSprite):
+            surface, area, (offset_x, offset_y), (width, height) = source.surface, source.area, source.offset, source.area.size
+        else:
+            surface, area, (offset_x, offset_y), (width, height) = source, None, (0, 0), source.get_size()
+        clip = self.clip_rect
+        if numpy is None:
+            visible = [rect for rect in (self.blit(source, dest) for dest in zip(xs, ys)) if rect.width and rect.height]
+            if len(visible) <= rect_limit or not visible:
+                return visible
+            return [visible[0].unionall(visible)]
+        lefts = numpy.asarray(xs, dtype=numpy.int64) + offset_x
+        tops = numpy.asarray(ys, dtype=numpy.int64) + offset_y
+        visible_lefts, visible_tops = numpy.maximum(lefts, clip.left), numpy.maximum(tops, clip.top)
+        visible_rights, visible_bottoms = numpy.minimum(lefts + width, clip.right), numpy.minimum(tops + height, clip.bottom)
+        shown = (visible_rights > visible_lefts) & (visible_bottoms > visible_tops)
+        whole = shown & (visible_rights - visible_lefts == width) & (visible_bottoms - visible_tops == height)
+        clipped = shown & ~whole
+        if whole.any():
+            dests = zip(lefts[whole].tolist(), tops[whole].tolist())
+            self._add_blit_items(zip(repeat(surface), dests) if area is None else zip(repeat(surface), dests, repeat(area)))
+        if clipped.any():
+            area_x, area_y = (area.x, area.y) if area is not None else (0, 0)
+            clipped_lefts, clipped_tops = visible_lefts[clipped], visible_tops[clipped]
+            areas = zip((clipped_lefts - lefts[clipped] + area_x).tolist(), (clipped_tops - tops[clipped] + area_y).tolist(),
+                        (visible_rights[clipped] - clipped_lefts).tolist(), (visible_bottoms[clipped] - clipped_tops).tolist())
+            self._add_blit_items(zip(repeat(surface), zip(clipped_lefts.tolist(), clipped_tops.tolist()), areas))
+        visible_lefts, visible_tops = visible_lefts[shown], visible_tops[shown]
+        visible_rights, visible_bottoms = visible_rights[shown], visible_bottoms[shown]
+        if not len(visible_lefts):
+            return []
+        if len(visible_lefts) <= rect_limit:
+            return [pygame.Rect(left, top, right - left, bottom - top) for left, top, right, bottom in
+                    zip(visible_lefts.tolist(), visible_tops.tolist(), visible_rights.tolist(), visible_bottoms.tolist())]
+        left, top = int(visible_lefts.min()), int(visible_tops.min())
+        return [pygame.Rect(left, top, int(visible_rights.max()) - left, int(visible_bottoms.max()) - top)]
+
+    def fill(self, color, rect):
+        visible = pygame.Rect(rect).clip(self.clip_rect)
+        if visible.width and visible.height:
+            self._ops.append(("fill", color, visible))
+        return visible
+
+    def _add_blit_items(self, items):
+        if self._ops and self._ops[-1][0] == "blit":
+            self._ops[-1][1].extend(items)
+        else:
+            self._ops.append(("blit", list(items)))
+
+    def flush(self, target):
+        for op in self._ops:
+            if op[0] == "blit":
+                target.blits(op[1], doreturn=False)
+            else:
+                target.fill(op[1], op[2])
+        self._ops = []
+
+def scale_surface(surface, scale):
+    size = (max(1, round(surface.get_width() * scale)), max(1, round(surface.get_height() * scale)))
+    return asset_memory.track(pygame.transform.smoothscale(surface, size), f"Scaled copy x{scale:g}", source=surface)
+
+scaled_scene_sprites = {} # (game type, scale) -> sprites shared by every viewport drawn at that scale
+
+def scene_sprites(game_type, scale):
+    # The sprites a game is drawn with at `scale`: the loaded assets and caches themselves for
+    # the full screen, smoothscaled copies (built once per scale) for classroom viewports.
+    # The texture backend rotates, scales and composites on the renderer instead of through the caches.
+    sprites = untransformed_scene_sprites(game_type, scale)
+    if texture_renderer:
+        sprites = dict(sprites)
+        if "scale_rotations" in sprites:
+            sprites["scale_rotations"] = TextureRotations(sprites["scale_rotations"])
+        if "bacteria_scales" in sprites:
+            sprites["bacteria_scales"] = TextureScales(sprites["bacteria_scales"])
+        if "backgrounds" in sprites:
+            sprites["backgrounds"] = TextureOsmoticBackgrounds(sprites["backgrounds"])
+    return sprites
+
+def untransformed_scene_sprites(game_type, scale):
+    if scale == 1.0:
+        if game_type == "oxidative_stress":
+            return {"background": game_background_os_img, "bacteria": bacteria_os_images, "scale_rotations": scale_balance_rotations}
+        if game_type == "osmotic_shock":
+            return {"backgrounds": osmotic_backgrounds, "bacteria_scales": bacteria_osmo_scales, "salt": salt_particle_img}
+        return {"background": background_enzyme_img, "states": enzyme_state_images, "layers": enzyme_layers, "inhibitor": inhibitor_triangle_img}
+    key = (game_type, scale)
+    if key not in scaled_scene_sprites:
+        with asset_memory.group(game_type):
+            scaled_scene_sprites[key] = scaled_copies_of_scene_sprites(game_type, scale)
+    return scaled_scene_sprites[key]
+
+def scaled_copies_of_scene_sprites(game_type, scale):
+    # Smoothscaled copies of a game's sprites, and caches built on them, for one classroom scale
+    if game_type == "oxidative_stress":
+        sprites = {"background": scale_surface(game_background_os_img, scale),
+                   "bacteria": [scaled_sprite_atlas("oxidative_stress", scale)[f"bacteria_os_{i}"] for i in range(len(bacteria_os_images))],
+                   "scale_rotations": RotatedSpriteCache(scale_surface(scale_balance_img_orig, scale), SCALE_ROTATION_STEP_DEGREES,
+                                                         SCALE_ROTATION_CACHE_BUDGET_BYTES, name=f"Scale balance rotations x{scale:g}")}
+    elif game_type == "osmotic_shock":
+        sprites = {"backgrounds": OsmoticBackgroundCache(scale_surface(tap_osmo_img, scale), OSMOTIC_HUE_STEP_DEGREES,
+                                                         OSMOTIC_LAYER_CACHE_BUDGET_BYTES, name=f"Osmotic backgrounds x{scale:g}"),
+                   "bacteria_scales": ScaledSpriteCache(scale_surface(bacteria_osmo_img_orig, scale), MIN_BACTERIA_OSMO_SCALE, BACTERIA_OSMO_SCALE_LEVELS,
+                                                        BACTERIA_OSMO_SCALE_CACHE_BUDGET_BYTES, name=f"Osmotic bacteria scales x{scale:g}"),
+                   "salt": scaled_trimmed_sprite(salt_particle_img, scale)}
+    else:
+        sprites = {"background": scale_surface(background_enzyme_img, scale),
+                   "states": [scale_surface(enzyme_state_images[i], scale) for i in range(len(enzyme_state_images))],
+                   "inhibitor": scaled_trimmed_sprite(inhibitor_triangle_img, scale)}
+        sprites["layers"] = EnzymeLayerCache(sprites["background"], sprites["states"], ENZYME_LAYER_CACHE_BUDGET_BYTES,
+                                             name=f"Enzyme layers x{scale:g}")
+    return sprites
+
+class SceneView:
+    # Where one player's game is drawn: the whole screen in single-player, a scaled-down
+    # viewport in classroom mode. Maps the games' full-screen layout into screen positions
+    # and owns the HUD pieces at its scale.
+    def __init__(self, rect):
+        self.rect = pygame.Rect(rect)
+        self.scale = self.rect.width / SCREEN_WIDTH
+        if self.scale == 1.0:
+            self.hud = hud_resources
+        else:
+            if self.scale not in scaled_hud_resources:
+                scaled_hud_resources[self.scale] = HudResources(pygame.font.Font(None, max(1, round(render_length(100) * self.scale))),
+                                                                self.to_screen_size(TAP_BUTTON_VISUAL_RECT.size))
+            self.hud = scaled_hud_resources[self.scale]
+        self.flash_rect = self.to_screen_rect(TAP_BUTTON_VISUAL_RECT)
+        self.health_bar_os = HealthBarHud(self.hud, self.to_screen(HEALTH_BAR_POS_OS), self.to_screen_size(HEALTH_BAR_SIZE_OS), self.scale)
+        self.health_bar_ei = HealthBarHud(self.hud, self.to_screen(HEALTH_BAR_POS_EI), self.to_screen_size(HEALTH_BAR_SIZE_EI), self.scale)
+        self.finished_shade = None
+
+    def draw_flash(self, target):
+        return self.hud.draw_flash(target, self.flash_rect)
+
+    def to_screen(self, pos):
+        if self.scale == 1.0:
+            return (self.rect.x + pos[0], self.rect.y + pos[1])
+        return (self.rect.x + int(round(pos[0] * self.scale)), self.rect.y + int(round(pos[1] * self.scale)))
+
+    def to_screen_size(self, size):
+        if self.scale == 1.0:
+            return size
+        return (max(1, round(size[0] * self.scale)), max(1, round(size[1] * self.scale)))
+
+    def to_screen_rect(self, rect):
+        return pygame.Rect(self.to_screen(rect.topleft), self.to_screen_size(rect.size))
+
+    def blit_background(self, source, offset=(0, 0)):
+        # Background layers may be shifted by rumble; keep them inside the viewport
+        visible, item = clip_blit_item(source, (self.rect.x + offset[0], self.rect.y + offset[1]), self.rect)
+        if visible.width and visible.height:
+            screen.blit(*item)
+
+def classroom_viewports(player_count):
+    # Two players sit side by side, three or four share a 2x2 grid; each viewport keeps the
+    # screen's aspect ratio and is centred in its cell
+    columns, rows = 2, (1 if player_count == 2 else 2)
+    cell_w, cell_h = SCREEN_WIDTH // columns, SCREEN_HEIGHT // rows
+    scale = min(cell_w / SCREEN_WIDTH, cell_h / SCREEN_HEIGHT)
+    view_size = (int(SCREEN_WIDTH * scale), int(SCREEN_HEIGHT * scale))
+    viewports = []
+    for index in range(player_count):
+        cell = pygame.Rect((index % columns) * cell_w, (index // columns) * cell_h, cell_w, cell_h)
+        viewports.append(pygame.Rect((0, 0), view_size).move(cell.x + (cell_w - view_size[0]) // 2, cell.y + (cell_h - view_size[1]) // 2))
+    return viewports
+
+class Player:
+    # One seat at the machine: the key it taps, its own GameSimulation (health, salt particles,
+    # tap flash) and the view it is drawn in. finish_rank is set once its bacteria is knocked
+    # out, 1 being the first player to get there.
+    def __init__(self, number, key, view):
+        self.number = number
+        self.key = key
+        self.view = view
+        self.sim = GameSimulation(clock=session_clock)
+        self.sprites = None # scene_sprites() of the running game
+        self.finish_rank = None
+        self.badge = asset_memory.track(game_font_medium.render(f" P{number} [{pygame.key.name(key).upper()}] ", True, WHITE, BLACK),
+                                        "Player badges", "hud")
+
+player_count = input_replay.header.get("players", 1) if input_replay else cli_args.players
+classroom_mode = player_count > 1
+if classroom_mode:
+    players = [Player(index + 1, CLASSROOM_PLAYER_KEYS[index], SceneView(rect))
+               for index, rect in enumerate(classroom_viewports(player_count))]
+    rank_labels = [asset_memory.track(game_font_large.render(f"#{rank}", True, WHITE), "Rank labels", "hud")
+                   for rank in range(1, player_count + 1)]
+    for player in players:
+        player.view.finished_shade = asset_memory.track(pygame.Surface(player.view.rect.size, pygame.SRCALPHA), "Finished shades", "hud")
+        player.view.finished_shade.fill(CLASSROOM_FINISHED_SHADE)
+    print(f"DEBUG: Classroom mode with {player_count} players: " +
+          ", ".join(f"P{player.number} taps {pygame.key.name(player.key).upper()}" for player in players))
+else:
+    players = [Player(1, pygame.K_SPACE, SceneView(screen.get_rect()))]
+players_by_key = {player.key: player for player in players}
 
 # --- Helper Functions for Game ---
+GAME_TITLES = {"oxidative_stress": "Oxidative Stress", "osmotic_shock": "Osmotic Shock", "enzyme_inhibition": "Enzyme Inhibition"}
+
 def start_game(game_type_to_start):
-    global current_mode, health, active_game_type, salt_particles, tap_button_flash_timer
-    health = HEALTH_MAX
+    global current_mode, active_game_type
+    if game_type_to_start not in GAME_TITLES:
+        print(f"Warning: Unknown game '{game_type_to_start}' in the slide graph.")
+        return
     active_game_type = game_type_to_start
-    tap_button_flash_timer = 0 # Reset flash timer
-
-    if active_game_type == "oxidative_stress":
-        current_mode = "game_oxidative_stress"
-        rumble_loop_sound.set_volume(0) # Start silent, volume increases with damage
-        if rumble_loop_sound.get_num_channels() == 0: # Play only if not already playing
-            rumble_loop_sound.play(-1)
-    elif active_game_type == "osmotic_shock":
-        current_mode = "game_osmotic_shock"
-        salt_particles = []
-        if salt_particle_img:
-            for i in range(NUM_SALT_PARTICLES):
-                salt_particles.append({
-                    'x': SALT_X_POSITIONS[i],
-                    'y': random.randint(0, SCREEN_HEIGHT - salt_particle_img.get_height()),
-                    'vy': random.choice([-SALT_PARTICLE_SPEED_Y, SALT_PARTICLE_SPEED_Y]),
-                    'image': salt_particle_img
-                })
-        rumble_loop_sound.set_volume(0)
-        if rumble_loop_sound.get_num_channels() == 0:
-            rumble_loop_sound.play(-1)
-    elif active_game_type == "enzyme_inhibition":
-        current_mode = "game_enzyme_inhibition"
-        rumble_loop_sound.set_volume(0)
-        if rumble_loop_sound.get_num_channels() == 0:
-            rumble_loop_sound.play(-1)
+    ensure_asset_group(active_game_type)
+    start_time = session_clock()
+    for player in players:
+        if active_game_type == "osmotic_shock":
+            player.sim.salt_particles.set_image(salt_particle_img)
+        player.sim.reset(with_salt_particles=(active_game_type == "osmotic_shock"), now=start_time)
+        player.sprites = scene_sprites(active_game_type, player.view.scale)
+        player.finish_rank = None
+
+    current_mode = "game_" + active_game_type
+    audio.start_rumble() # Start silent, volume increases with damage
+    if telemetry:
+        telemetry.record("game_start", game=active_game_type, players=len(players))
     print(f"DEBUG: Starting game: {current_mode}")
 
-def update_oxidative_stress_game():
-    global health, current_mode, current_slide_index, active_game_type
-
-    if health < HEALTH_MAX and health > HEALTH_MIN:
-        health += REGEN_RATE
-        health = min(health, HEALTH_MAX)
-    
-    if active_game_type == "oxidative_stress":
-        health_ratio_for_rumble = max(0, health / HEALTH_MAX)
-        rumble_volume = (1.0 - health_ratio_for_rumble)**2 
-        rumble_loop_sound.set_volume(min(1.0, max(0.0, rumble_volume)))
-
-    if health <= HEALTH_MIN:
-        health = HEALTH_MIN
-        current_mode = "slideshow"
-        rumble_loop_sound.stop()
-        game_finish_sound.play()
-        if active_game_type == "oxidative_stress":
-            current_slide_index = 4 # OS_BOOM_SLIDE_INDEX (assuming slide 4 is "boom" for OS)
-        active_game_type = None
-        print("DEBUG: Oxidative Stress game ended.")
-
-def draw_oxidative_stress_game_elements():
-    global tap_button_flash_timer
-    screen.blit(game_background_os_img, (0, 0))
+def advance_players(now):
+    # Every simulation was reset with the same clock read, so all players are due the same ticks
+    return min([player.sim.advance(now) for player in players])
+
+# Runs once per simulation tick, right after every player's sim.tick()
+def update_game_players():
+    global current_mode, current_slide_index, active_game_type
+
+    playing = [player for player in players if player.finish_rank is None]
+    health_ratio_for_rumble = max(0, min(player.sim.health for player in playing) / HEALTH_MAX)
+    rumble_volume = (1.0 - health_ratio_for_rumble)**2 
+    audio.set_rumble_volume(rumble_volume)
+
+    finished_count = len(players) - len(playing)
+    for player in playing:
+        if player.sim.health <= HEALTH_MIN:
+            player.sim.health = HEALTH_MIN
+            finished_count += 1
+            player.finish_rank = finished_count
+            if telemetry:
+                telemetry.record("player_finished", game=active_game_type, player=player.number, rank=player.finish_rank)
+            if classroom_mode:
+                print(f"DEBUG: Player {player.number} finished #{player.finish_rank}.")
+    if finished_count < len(players):
+        return
+
+    current_mode = "slideshow"
+    audio.stop_rumble()
+    audio.play_finish()
+    current_slide_index = slide_graph.end_slide_by_game[active_game_type]
+    print(f"DEBUG: {GAME_TITLES[active_game_type]} game ended.")
+    if telemetry:
+        telemetry.record("game_end", game=active_game_type)
+        telemetry.record("slide", slide=current_slide_index)
+    active_game_type = None
+
+# Each game has a background function, returning (scene key, paint function) for the
+# renderer, and an elements function that draws the moving parts into a BlitBatch.
+def oxidative_stress_background(player):
+    return (), lambda: player.view.blit_background(player.sprites["background"])
+
+def scale_balance_rotation(health_ratio):
+    return -MAX_SCALE_ROTATION_DEGREES * (health_ratio * 2 - 1) # maps 0-1 to -MAX to +MAX
+
+def draw_oxidative_stress_elements(player, batch):
+    view, sprites, sim = player.view, player.sprites, player.sim
+    health = sim.display_health()
 
     bacteria_img_to_draw = None
-    if health > 75: bacteria_img_to_draw = bacteria_os_images[0]
-    elif health > 50: bacteria_img_to_draw = bacteria_os_images[1]
-    elif health > 25: bacteria_img_to_draw = bacteria_os_images[2]
-    else: bacteria_img_to_draw = bacteria_os_images[3]
+    if health > 75: bacteria_img_to_draw = sprites["bacteria"][0]
+    elif health > 50: bacteria_img_to_draw = sprites["bacteria"][1]
+    elif health > 25: bacteria_img_to_draw = sprites["bacteria"][2]
+    else: bacteria_img_to_draw = sprites["bacteria"][3]
 
     if bacteria_img_to_draw:
-        base_bacteria_rect = bacteria_img_to_draw.get_rect(center=BACTERIA_POS_OS)
+        base_bacteria_rect = bacteria_img_to_draw.get_rect(center=view.to_screen(BACTERIA_POS_OS))
         current_rumble_x, current_rumble_y = 0, 0
         if health < HEALTH_MAX and health > HEALTH_MIN: # Rumble only when not full or min health
             rumble_intensity_factor = (HEALTH_MAX - health) / HEALTH_MAX
             effective_intensity = rumble_intensity_factor ** 2 
-            max_offset = MAX_RUMBLE_OFFSET * effective_intensity
+            max_offset = MAX_RUMBLE_OFFSET * view.scale * effective_intensity
             if max_offset > 0.5 : # Only rumble if offset is somewhat significant
                 current_rumble_x = random.randint(-int(max_offset), int(max_offset))
                 current_rumble_y = random.randint(-int(max_offset), int(max_offset))
         final_draw_topleft = (base_bacteria_rect.left + current_rumble_x, base_bacteria_rect.top + current_rumble_y)
-        screen.blit(bacteria_img_to_draw, final_draw_topleft)
+        renderer.mark(batch.blit(bacteria_img_to_draw, final_draw_topleft))
 
     health_ratio = max(0, health / HEALTH_MAX)
-    bar_width = int(HEALTH_BAR_SIZE_OS[0] * health_ratio)
-    
-    # Smooth color transition for health bar
-    if health_ratio > 0.5: # Green to Yellow (100% to 50%)
-        g = 255
-        r = int(255 * (1 - (health_ratio - 0.5) * 2)) 
-    else: # Yellow to Red (50% to 0%)
-        r = 255
-        g = int(255 * (health_ratio * 2))
-    bar_color = (max(0, min(255, r)), max(0, min(255, g)), 0)
-
-
-    pygame.draw.rect(screen, BLACK, (HEALTH_BAR_POS_OS[0]-2, HEALTH_BAR_POS_OS[1]-2, HEALTH_BAR_SIZE_OS[0]+4, HEALTH_BAR_SIZE_OS[1]+4))
-    pygame.draw.rect(screen, bar_color, (HEALTH_BAR_POS_OS[0], HEALTH_BAR_POS_OS[1], bar_width, HEALTH_BAR_SIZE_OS[1]))
-
-    health_text_surf = game_font_large.render(f"{int(health)}%", True, WHITE)
-    health_text_rect = health_text_surf.get_rect(midright=(HEALTH_BAR_POS_OS[0] - 30, HEALTH_BAR_POS_OS[1] + HEALTH_BAR_SIZE_OS[1] // 2))
-    screen.blit(health_text_surf, health_text_rect)
-
-    if scale_balance_img_orig:
-        rotation = -MAX_SCALE_ROTATION_DEGREES * (health_ratio * 2 - 1) # maps 0-1 to -MAX to +MAX
-        rotated_scale = pygame.transform.rotate(scale_balance_img_orig, rotation)
-        scale_rect = rotated_scale.get_rect(center=SCALE_POS_OS)
-        screen.blit(rotated_scale, scale_rect.topleft)
-
-    if tap_button_flash_timer > 0:
-        flash_surface = pygame.Surface(TAP_BUTTON_VISUAL_RECT.size, pygame.SRCALPHA)
-        flash_surface.fill(FLASH_COLOR)
-        screen.blit(flash_surface, TAP_BUTTON_VISUAL_RECT.topleft)
-        tap_button_flash_timer -= 1
-
-def update_osmotic_shock_game():
-    global health, current_mode, current_slide_index, active_game_type, salt_particles
-    if health < HEALTH_MAX and health > HEALTH_MIN:
-        health += REGEN_RATE
-        health = min(health, HEALTH_MAX)
-
-    if salt_particle_img:
-        for particle in salt_particles:
-            particle['y'] += particle['vy']
-            particle_height = particle['image'].get_height()
-            if particle['y'] < -particle_height: # Particle fully off screen top
-                 particle['y'] = SCREEN_HEIGHT # Reappear at bottom
-            elif particle['y'] > SCREEN_HEIGHT: # Particle fully off screen bottom
-                 particle['y'] = -particle_height # Reappear at top
-            # Keep bouncing logic if preferred, or use wrap-around like above
-            # if particle['y'] < 0 or particle['y'] + particle_height > SCREEN_HEIGHT:
-            #     particle['vy'] *= -1
-            #     particle['y'] = max(0, min(particle['y'], SCREEN_HEIGHT - particle_height))
-
-    if active_game_type == "osmotic_shock":
-        health_ratio_for_rumble = max(0, health / HEALTH_MAX)
-        rumble_volume = (1.0 - health_ratio_for_rumble)**2 
-        rumble_loop_sound.set_volume(min(1.0, max(0.0, rumble_volume)))
-
-    if health <= HEALTH_MIN:
-        health = HEALTH_MIN
-        current_mode = "slideshow"
-        rumble_loop_sound.stop()
-        game_finish_sound.play()
-        if active_game_type == "osmotic_shock":
-            current_slide_index = OSMOTIC_GAME_BOOM_SLIDE_INDEX
-        active_game_type = None
-        print("DEBUG: Osmotic Shock game ended.")
+    for hud_rect in view.health_bar_os.draw(batch, health):
+        renderer.mark(hud_rect)
 
+    if sprites["scale_rotations"]:
+        rotated_scale = sprites["scale_rotations"].get(scale_balance_rotation(health_ratio))
+        scale_rect = rotated_scale.get_rect(center=view.to_screen(SCALE_POS_OS))
+        renderer.mark(batch.blit(rotated_scale, scale_rect.topleft))
 
-def draw_osmotic_shock_game_elements():
-    global tap_button_flash_timer
-    health_ratio = max(0, health / HEALTH_MAX)
-    
+    if sim.flash_visible():
+        renderer.mark(view.draw_flash(batch))
+
+def osmotic_background_hue(health_ratio):
     # Background color transition: Cyan (full health) -> Purple (mid health) -> Red (low health)
     current_hue = 0 # Default to Red
     if health_ratio > 0.5: # Cyan to Purple
@@ -428,107 +2338,92 @@ def draw_osmotic_shock_game_elements():
         # health_ratio * 2 gives a 0-1 range for the bottom 50% health
         # We want to go from 0 up to 270
         current_hue = 270 * (health_ratio * 2)
+    return current_hue % 360
 
+def osmotic_shock_background(player):
+    view, sprites = player.view, player.sprites
+    current_hue = osmotic_background_hue(max(0, player.sim.display_health() / HEALTH_MAX))
 
-    background_color = pygame.Color(0); background_color.hsla = (current_hue % 360, 100, 50, 100)
-    screen.fill(background_color)
+    # The colour and the full-screen UI overlay on top of it come pre-composited in one opaque
+    # layer per hue step, so the background only needs a full repaint when the step changes
+    hue_key = sprites["backgrounds"].quantize(current_hue)
 
-    if tap_osmo_img: # Draw UI overlay
-        # Ensure tap_osmo_img is scaled to SCREEN_WIDTH, SCREEN_HEIGHT if it's a full overlay
-        # If it's just a small element, position it correctly. Assuming it's full screen.
-        screen.blit(tap_osmo_img, (0,0))
+    def paint_osmotic_shock_background():
+        view.blit_background(sprites["backgrounds"].get(current_hue))
+    return hue_key, paint_osmotic_shock_background
 
+def draw_osmotic_shock_elements(player, batch):
+    view, sprites, sim = player.view, player.sprites, player.sim
+    health = sim.display_health()
+    health_ratio = max(0, health / HEALTH_MAX)
 
-    if bacteria_osmo_img_orig:
-        current_scale = MIN_BACTERIA_OSMO_SCALE + (1.0 - MIN_BACTERIA_OSMO_SCALE) * health_ratio
-        orig_w, orig_h = bacteria_osmo_img_orig.get_size()
-        scaled_w, scaled_h = int(orig_w * current_scale), int(orig_h * current_scale)
+    if sprites["bacteria_scales"]:
+        scaled_bacteria = sprites["bacteria_scales"].get(health_ratio)
+        base_rect = scaled_bacteria.get_rect(center=view.to_screen(BACTERIA_OSMO_CENTER_POS))
         
-        if scaled_w > 0 and scaled_h > 0: # Ensure dimensions are valid
-            scaled_bacteria = pygame.transform.smoothscale(bacteria_osmo_img_orig, (scaled_w, scaled_h))
-            base_rect = scaled_bacteria.get_rect(center=BACTERIA_OSMO_CENTER_POS)
-            
-            rumble_x, rumble_y = 0, 0
-            if health < HEALTH_MAX * 0.85 and health > HEALTH_MIN: # Rumble below 85% health
-                intensity_factor = (HEALTH_MAX - health) / HEALTH_MAX 
-                effective_intensity = intensity_factor ** 2.0 # Adjust power for feel
-                max_offset = MAX_RUMBLE_OFFSET * 2 * effective_intensity # More rumble for this game
-                if max_offset > 0.5:
-                    rumble_x = random.randint(-int(max_offset), int(max_offset))
-                    rumble_y = random.randint(-int(max_offset), int(max_offset))
-            final_topleft = (base_rect.left + rumble_x, base_rect.top + rumble_y)
-            screen.blit(scaled_bacteria, final_topleft)
-
-    if salt_particle_img:
+        rumble_x, rumble_y = 0, 0
+        if health < HEALTH_MAX * 0.85 and health > HEALTH_MIN: # Rumble below 85% health
+            intensity_factor = (HEALTH_MAX - health) / HEALTH_MAX 
+            effective_intensity = intensity_factor ** 2.0 # Adjust power for feel
+            max_offset = MAX_RUMBLE_OFFSET * 2 * view.scale * effective_intensity # More rumble for this game
+            if max_offset > 0.5:
+                rumble_x = random.randint(-int(max_offset), int(max_offset))
+                rumble_y = random.randint(-int(max_offset), int(max_offset))
+        final_topleft = (base_rect.left + rumble_x, base_rect.top + rumble_y)
+        renderer.mark(batch.blit(scaled_bacteria, final_topleft))
+
+    if sprites["salt"]:
         # Show more salt particles as health decreases
         num_to_show = int(((HEALTH_MAX - health) / HEALTH_MAX) * NUM_SALT_PARTICLES * 1.5) # Show up to 1.5x NUM_SALT_PARTICLES
         num_to_show = min(num_to_show, NUM_SALT_PARTICLES) # Cap at the actual number of particles available
-        
-        for i in range(num_to_show):
-            if i < len(salt_particles): # Check index bounds
-                particle = salt_particles[i]
-                screen.blit(particle['image'], (particle['x'], particle['y']))
+        for particle_rect in sim.salt_particles.draw(batch, num_to_show, sim.interpolation_alpha(),
+                                                     sprites["salt"], view.scale, view.rect.topleft):
+            renderer.mark(particle_rect)
 
     # No separate health bar for osmotic shock, visual is bacteria size and background color
     # But "TAP!" flash is still relevant
-    if tap_button_flash_timer > 0:
-        # TAP_BUTTON_VISUAL_RECT should be defined for this game's "TAP!" button area
-        # Reusing the global one, ensure it makes sense or define a new one for this game
-        flash_surface = pygame.Surface(TAP_BUTTON_VISUAL_RECT.size, pygame.SRCALPHA)
-        flash_surface.fill(FLASH_COLOR)
-        screen.blit(flash_surface, TAP_BUTTON_VISUAL_RECT.topleft)
-        tap_button_flash_timer -= 1
-
-def update_enzyme_inhibition_game():
-    global health, current_mode, current_slide_index, active_game_type
-    if health < HEALTH_MAX and health > HEALTH_MIN:
-        health += REGEN_RATE 
-        health = min(health, HEALTH_MAX)
-            
-    if active_game_type == "enzyme_inhibition":
-        health_ratio_for_rumble = max(0, health / HEALTH_MAX)
-        rumble_volume = (1.0 - health_ratio_for_rumble)**2 
-        rumble_loop_sound.set_volume(min(1.0, max(0.0, rumble_volume)))
-
-    if health <= HEALTH_MIN:
-        health = HEALTH_MIN
-        current_mode = "slideshow"
-        rumble_loop_sound.stop()
-        game_finish_sound.play()
-        if active_game_type == "enzyme_inhibition":
-            current_slide_index = ENZYME_GAME_BOOM_SLIDE_INDEX
-        active_game_type = None
-        print("DEBUG: Enzyme Inhibition game ended.")
-
-def draw_enzyme_inhibition_game_elements():
-    global tap_button_flash_timer
-
-    if background_enzyme_img:
-        screen.blit(background_enzyme_img, (0, 0))
-    else:
-        screen.fill((30,30,30))
+    if sim.flash_visible():
+        renderer.mark(view.draw_flash(batch))
+
+def enzyme_inhibition_background(player):
+    view, sprites = player.view, player.sprites
+    health = player.sim.display_health()
+    enzyme_states = sprites["states"]
 
-    current_enzyme_img_to_draw = None
+    state_index = None
     if health > 66: # State 1 (healthiest)
-        if len(enzyme_state_images) > 0: current_enzyme_img_to_draw = enzyme_state_images[0]
+        if len(enzyme_states) > 0: state_index = 0
     elif health > 33: # State 2 (medium)
-        if len(enzyme_state_images) > 1: current_enzyme_img_to_draw = enzyme_state_images[1]
+        if len(enzyme_states) > 1: state_index = 1
     else: # State 3 (lowest health)
-        if len(enzyme_state_images) > 2: current_enzyme_img_to_draw = enzyme_state_images[2]
+        if len(enzyme_states) > 2: state_index = 2
     
-    if current_enzyme_img_to_draw:
-        rumble_x, rumble_y = 0, 0
+    rumble_x, rumble_y = 0, 0
+    if state_index is not None:
         if health < 60.0 and health > HEALTH_MIN: # Rumble below 60% health
             rumble_intensity_factor = (60.0 - max(HEALTH_MIN, health)) / 60.0 
             effective_intensity = rumble_intensity_factor ** 1.5
-            max_offset = MAX_RUMBLE_OFFSET * effective_intensity
+            max_offset = MAX_RUMBLE_OFFSET * view.scale * effective_intensity
             if max_offset > 0.5:
                 rumble_x = random.randint(-int(max_offset), int(max_offset))
                 rumble_y = random.randint(-int(max_offset), int(max_offset))
-        screen.blit(current_enzyme_img_to_draw, (rumble_x, rumble_y))
-
 
-    if inhibitor_triangle_img:
+    def paint_enzyme_inhibition_background():
+        if state_index is not None and (rumble_x, rumble_y) == (0, 0):
+            # At rest the background and enzyme state are one pre-composited opaque layer
+            view.blit_background(sprites["layers"].get(state_index))
+            return
+        view.blit_background(sprites["background"])
+        if state_index is not None:
+            view.blit_background(enzyme_states[state_index], (rumble_x, rumble_y))
+    # The full-screen enzyme state is part of the background, so any rumble repaints everything
+    return (state_index, rumble_x, rumble_y), paint_enzyme_inhibition_background
+
+def draw_enzyme_inhibition_elements(player, batch):
+    view, sprites, sim = player.view, player.sprites, player.sim
+    health = sim.display_health()
+
+    if sprites["inhibitor"]:
         inhibitor_current_x = INHIBITOR_END_X # Default to "in" position
         # Inhibitor moves out as health increases from 0 to 100
         # Health 0: inhibitor at END_X
@@ -536,138 +2431,879 @@ def draw_enzyme_inhibition_game_elements():
         health_ratio_for_movement = health / HEALTH_MAX
         inhibitor_current_x = INHIBITOR_END_X + (INHIBITOR_START_X - INHIBITOR_END_X) * health_ratio_for_movement
         
-        screen.blit(inhibitor_triangle_img, (inhibitor_current_x, INHIBITOR_Y))
-
-    health_ratio = max(0, health / HEALTH_MAX)
-    current_bar_width_ei = int(HEALTH_BAR_SIZE_EI[0] * health_ratio)
-
-    if health_ratio > 0.5:
-        g = 255
-        r = int(255 * (1 - (health_ratio - 0.5) * 2))
+        renderer.mark(batch.blit(sprites["inhibitor"], view.to_screen((inhibitor_current_x, INHIBITOR_Y))))
+
+    for hud_rect in view.health_bar_ei.draw(batch, health):
+        renderer.mark(hud_rect)
+
+    if sim.flash_visible():
+        renderer.mark(view.draw_flash(batch))
+
+GAME_SCENES = {
+    "game_oxidative_stress": (oxidative_stress_background, draw_oxidative_stress_elements),
+    "game_osmotic_shock": (osmotic_shock_background, draw_osmotic_shock_elements),
+    "game_enzyme_inhibition": (enzyme_inhibition_background, draw_enzyme_inhibition_elements),
+}
+scene_batch = BlitBatch(screen.get_rect())
+
+def paint_game_backgrounds(backgrounds):
+    if classroom_mode:
+        screen.fill(BLACK) # Gaps between viewports
+    for player, (_, paint_background) in zip(players, backgrounds):
+        paint_background()
+        if classroom_mode:
+            if player.finish_rank is not None:
+                screen.blit(player.view.finished_shade, player.view.rect)
+                rank_label = rank_labels[player.finish_rank - 1]
+                screen.blit(rank_label, rank_label.get_rect(center=player.view.rect.center))
+            screen.blit(player.badge, player.view.rect.topleft)
+
+def draw_game_players():
+    # All viewports share one scene key and one batch, so the frame is a single background
+    # pass plus one Surface.blits call per run of sprites
+    background_function, elements_function = GAME_SCENES[current_mode]
+    backgrounds = [background_function(player) for player in players]
+    scene_key = (current_mode,) + tuple((key, player.finish_rank) for player, (key, _) in zip(players, backgrounds))
+    renderer.begin_frame(scene_key, lambda: paint_game_backgrounds(backgrounds))
+    for player in players:
+        if player.finish_rank is None:
+            scene_batch.clip_rect = player.view.rect
+            elements_function(player, scene_batch)
+    scene_batch.flush(screen)
+    for player in players:
+        if player.finish_rank is None:
+            prefetch_next_frame_transforms(player)
+
+def prefetch_next_frame_transforms(player):
+    # Health only moves by a regen tick or a tap between frames, so queue the sprites for both
+    # outcomes; transform_worker builds them while this frame presents and the next one waits.
+    # Rotations are only prepared for the regen outcome: the key a tap lands on changes every
+    # frame, and with a few entries in budget building it each frame would evict the entries
+    # regen climbs back through. Osmotic backgrounds are composited with blits and convert,
+    # which hold the GIL, so they are never prepared here.
+    sim, sprites = player.sim, player.sprites
+    for health in (min(sim.health + REGEN_RATE, HEALTH_MAX), max(sim.health - DAMAGE_PER_TAP, HEALTH_MIN)):
+        health_ratio = max(0, health / HEALTH_MAX)
+        if current_mode == "game_oxidative_stress":
+            if sprites["scale_rotations"] and health > sim.health:
+                sprites["scale_rotations"].prefetch(scale_balance_rotation(health_ratio))
+        elif current_mode == "game_osmotic_shock":
+            if sprites["bacteria_scales"]:
+                sprites["bacteria_scales"].prefetch(health_ratio)
+
+# --- Frame Profiler ---
+class FrameProfiler:
+    # Times each phase of the main loop into fixed-size ring buffers (milliseconds per frame).
+    # The loop calls begin_frame(), then lap(phase) as each phase finishes, then end_frame(mode).
+    PHASES = ("pump", "events", "update", "draw", "present", "tick")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.phase_ms = {phase: array('d', bytes(8 * capacity)) for phase in self.PHASES}
+        self.total_ms = array('d', bytes(8 * capacity))
+        self.frame_modes = [None] * capacity
+        self.frames_recorded = 0
+        self.overlay_visible = False
+        self._slot = 0
+        self._frame_start = 0.0
+        self._lap_start = 0.0
+        self._overlay_surface = None
+        self._overlay_rendered_at = 0.0
+        self._overlay_font = None
+
+    def begin_frame(self):
+        self._slot = self.frames_recorded % self.capacity
+        for phase in self.PHASES:
+            self.phase_ms[phase][self._slot] = 0.0
+        self._frame_start = self._lap_start = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phase_ms[phase][self._slot] += (now - self._lap_start) * 1000.0
+        self._lap_start = now
+
+    def end_frame(self, mode):
+        self.total_ms[self._slot] = (self._lap_start - self._frame_start) * 1000.0
+        self.frame_modes[self._slot] = mode
+        self.frames_recorded += 1
+
+    def last_frame_ms(self):
+        # (frame time, frame time without the frame cap sleep) of the frame end_frame() just closed
+        slot = (self.frames_recorded - 1) % self.capacity
+        return self.total_ms[slot], self.total_ms[slot] - self.phase_ms["tick"][slot]
+
+    def recent_slots(self, count):
+        # Ring buffer slots of the last `count` frames, oldest first
+        count = min(count, self.frames_recorded, self.capacity)
+        return [(self.frames_recorded - count + i) % self.capacity for i in range(count)]
+
+    def phase_stats(self, frames=None):
+        slots = self.recent_slots(frames or self.capacity)
+        stats = {}
+        for phase in self.PHASES:
+            stats[phase] = percentiles([self.phase_ms[phase][slot] for slot in slots])
+        stats["total"] = percentiles([self.total_ms[slot] for slot in slots])
+        return stats
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self._overlay_surface = None
+
+    def draw_overlay(self, target):
+        if not self.overlay_visible:
+            return None
+        now = time.perf_counter()
+        if self._overlay_surface is None or now - self._overlay_rendered_at >= PROFILER_OVERLAY_REFRESH_SECONDS:
+            self._overlay_surface = self._render_overlay()
+            self._overlay_rendered_at = now
+        return target.blit(self._overlay_surface, render_point((10, 10)))
+
+    def _render_overlay(self):
+        if self._overlay_font is None:
+            self._overlay_font = pygame.font.Font(None, render_length(28))
+        slots = self.recent_slots(PROFILER_ROLLING_FRAMES)
+        lines = [f"Frame profile (last {len(slots)} frames, ms)"]
+        if slots:
+            for phase in self.PHASES:
+                values = [self.phase_ms[phase][slot] for slot in slots]
+                lines.append(f"{phase:<8} avg {sum(values) / len(values):6.2f}   max {max(values):6.2f}")
+            worst_slots = sorted(self.recent_slots(self.capacity), key=lambda slot: self.total_ms[slot], reverse=True)[:3]
+            lines.append("Worst frames in buffer:")
+            for slot in worst_slots:
+                slowest_phase = max(self.PHASES, key=lambda phase: self.phase_ms[phase][slot])
+                lines.append(f"  {self.total_ms[slot]:6.2f} ({self.frame_modes[slot]}, mostly {slowest_phase})")
+        rendered = [self._overlay_font.render(line, True, WHITE) for line in lines]
+        line_height = self._overlay_font.get_linesize()
+        panel = pygame.Surface((max(r.get_width() for r in rendered) + 20, line_height * len(rendered) + 20), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        for i, text_surf in enumerate(rendered):
+            panel.blit(text_surf, (10, 10 + i * line_height))
+        return panel
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["frame", "mode"] + [f"{phase}_ms" for phase in self.PHASES] + ["total_ms"])
+            first_frame = self.frames_recorded - len(self.recent_slots(self.capacity))
+            for i, slot in enumerate(self.recent_slots(self.capacity)):
+                writer.writerow([first_frame + i, self.frame_modes[slot]]
+                                + [f"{self.phase_ms[phase][slot]:.4f}" for phase in self.PHASES]
+                                + [f"{self.total_ms[slot]:.4f}"])
+        print(f"DEBUG: Frame profile written to {path}")
+
+profiler = FrameProfiler(PROFILER_CAPACITY)
+
+# --- Input Latency ---
+class TapLatencyTracker:
+    # Tap-to-photon latency per game mode. The main loop calls tap_applied() for every tap that
+    # changed a simulation (stamped with when the key arrived) and frame_presented() right after
+    # each present; the first present after a tap is the one that shows its flash.
+    def __init__(self, bucket_ms, bucket_count):
+        self.bucket_ms = bucket_ms
+        self.bucket_count = bucket_count
+        self.histograms = {} # Mode -> tap counts per bucket (the last bucket also holds slower taps)
+        self.latencies_ms = {} # Mode -> every measured latency, for percentiles
+        self._pending = [] # (mode, arrival time) of taps not yet on screen
+
+    def tap_applied(self, mode, arrival_time):
+        self._pending.append((mode, arrival_time))
+
+    def frame_presented(self, present_time):
+        for mode, arrival_time in self._pending:
+            latency_ms = (present_time - arrival_time) * 1000.0
+            if mode not in self.histograms:
+                self.histograms[mode] = array('L', bytes(array('L').itemsize * self.bucket_count))
+                self.latencies_ms[mode] = []
+            self.histograms[mode][min(self.bucket_count - 1, int(latency_ms // self.bucket_ms))] += 1
+            self.latencies_ms[mode].append(latency_ms)
+        self._pending.clear()
+
+    def report(self):
+        return {mode: {"latency_ms": percentiles(self.latencies_ms[mode]),
+                       "bucket_ms": self.bucket_ms,
+                       "histogram": list(self.histograms[mode])}
+                for mode in self.histograms}
+
+    def summary_lines(self):
+        lines = []
+        for mode, histogram in self.histograms.items():
+            stats = percentiles(self.latencies_ms[mode])
+            lines.append(f"Tap latency in {mode}: {stats['count']} taps, p50 {stats['p50']:.1f} ms, "
+                         f"p95 {stats['p95']:.1f} ms, max {stats['max']:.1f} ms")
+            peak = max(histogram)
+            last_bucket = max(i for i, count in enumerate(histogram) if count)
+            for i in range(last_bucket + 1):
+                low = i * self.bucket_ms
+                label = f"{low:>3}+    ms" if i == self.bucket_count - 1 else f"{low:>3}-{low + self.bucket_ms:<3} ms"
+                lines.append(f"  {label} {'#' * round(40 * histogram[i] / peak):<40} {histogram[i]}")
+        return lines
+
+tap_latency = TapLatencyTracker(TAP_LATENCY_BUCKET_MS, TAP_LATENCY_BUCKETS)
+
+class FramePacer:
+    # Game frames sleep off the frame cap before polling input (instead of in clock.tick() after
+    # presenting), waiting in pygame.event.wait() so every event is stamped with the time it
+    # actually arrived. By default the frame starts once per 1/fps, as clock.tick() would. With
+    # --low-latency the frame starts as late as the predicted work allows before its present
+    # deadline, and a tap arriving during the wait starts it at once rather than queuing unseen.
+    def __init__(self, fps, low_latency, history_frames, work_percentile, safety_ms):
+        self.frame_seconds = 1.0 / fps
+        self.low_latency = low_latency
+        self.work_percentile = work_percentile
+        self.safety_seconds = safety_ms / 1000.0
+        self.work_seconds = deque(maxlen=history_frames)
+        self._next_present_time = 0.0
+        self._next_frame_start_time = 0.0 # Default pacing's deadline, kept on a 1/fps grid
+        self._frame_start_time = 0.0
+
+    def predicted_work_seconds(self):
+        if not self.work_seconds:
+            return 0.0
+        ordered = sorted(self.work_seconds)
+        return ordered[int(self.work_percentile * (len(ordered) - 1))]
+
+    def wait_for_frame(self, next_input_time=None):
+        # Returns the events that arrived during the wait. next_input_time: when input not coming
+        # through SDL (benchmark taps) is next due, so --low-latency can wake for it like for a real tap
+        if self.low_latency:
+            wake_time = self._next_present_time - self.predicted_work_seconds() - self.safety_seconds
+            if next_input_time is not None:
+                wake_time = min(wake_time, next_input_time)
+        else:
+            wake_time = self._next_frame_start_time
+        events = []
+        while True:
+            remaining_ms = int((wake_time - time.perf_counter()) * 1000.0) # Waking under 1 ms early beats overshooting
+            if remaining_ms <= 0:
+                break
+            event = pygame.event.wait(remaining_ms)
+            if event.type == pygame.NOEVENT:
+                break
+            event.arrival_time = time.perf_counter()
+            events.append(event)
+            if self.low_latency and event.type == pygame.KEYDOWN:
+                break
+        self._frame_start_time = time.perf_counter()
+        # Advanced from the deadline rather than the wake time, so waking early does not speed
+        # up the cadence; a frame that overran starts the grid again from now, like clock.tick()
+        self._next_frame_start_time = max(wake_time + self.frame_seconds, self._frame_start_time)
+        return events
+
+    def frame_presented(self, present_time):
+        self.work_seconds.append(present_time - self._frame_start_time)
+        # A late frame moves the schedule instead of making the next frames rush to catch up
+        self._next_present_time = max(self._next_present_time + self.frame_seconds, present_time)
+
+frame_pacer = None
+if GAME_FPS > 0:
+    frame_pacer = FramePacer(GAME_FPS, cli_args.low_latency, LOW_LATENCY_WORK_HISTORY, LOW_LATENCY_WORK_PERCENTILE,
+                             LOW_LATENCY_SAFETY_MS)
+
+# --- Benchmark Driver ---
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {"p50": pick(0.50), "p90": pick(0.90), "p95": pick(0.95), "p99": pick(0.99),
+            "max": ordered[-1], "mean": sum(ordered) / len(ordered), "count": len(ordered)}
+
+class BenchmarkDriver:
+    # Feeds one mode a synthetic input stream at tap_rate per second (spacebar taps in the games,
+    # clicks on a visible button in the slideshow) and records frame timings. Games that end are
+    # restarted so the whole run stays in the requested mode. With trace_allocations, every
+    # frame's allocations are traced instead and the (traced, so inflated) timings are dropped:
+    # bench_bioapp.py runs that as a separate pass.
+    def __init__(self, mode, tap_rate, duration, output_path, trace_allocations=False):
+        self.mode = mode
+        self.tap_rate = tap_rate
+        self.duration = duration
+        self.output_path = output_path
+        self.trace_allocations = trace_allocations
+        self.taps_sent = 0
+        self.game_restarts = 0
+        self.startup_seconds = None
+        self.frame_ms = [] # Present-to-present time, including the frame cap sleep
+        self.work_ms = [] # Time spent on events, update, draw and present only
+        self.alloc_peak_bytes = [] # Peak Python heap growth within a traced frame
+        self.alloc_retained_bytes = [] # Python heap growth still held at the end of a traced frame
+        self._frame_index = 0
+        self._game_started = False
+        self._start_time = None
+        self._next_tap_time = None
+        self._last_present_time = None
+        self._work_start_time = None
+        self._traced_at_start = 0
+        if trace_allocations:
+            # Started once and left running: starting and stopping it per frame races with
+            # pygame's mixer taking the GIL from SDL's audio thread (a use-after-free on Python 3.11)
+            tracemalloc.start()
+
+    def before_events(self):
+        global current_slide_index
+        now = time.perf_counter()
+        if self._start_time is None:
+            self._start_time = now
+            self._next_tap_time = now
+        if self.mode != "slideshow" and current_mode != self.mode:
+            if self._game_started: # end_game() has already switched back to the slideshow by now
+                self.game_restarts += 1
+            self._game_started = True
+            start_game(self.mode[len("game_"):])
+        if self.tap_rate <= 0:
+            return
+        while self._next_tap_time <= now:
+            tap_time = self._next_tap_time
+            self._next_tap_time += 1.0 / self.tap_rate
+            self.taps_sent += 1
+            if self.mode == "slideshow":
+                visible_buttons = slide_graph.buttons_by_slide[current_slide_index]
+                if not visible_buttons: # Dead-end slide: jump back to the start
+                    current_slide_index = 0
+                    continue
+                button_data = visible_buttons[self.taps_sent % len(visible_buttons)]
+                pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=button_data["rect"].center))
+                break # One click per frame: the next one has to target the slide this one leads to
+            else:
+                tap_key = players[self.taps_sent % len(players)].key # Classroom runs spread taps over all players
+                # Stamped with when the tap was due, so time spent in the frame cap sleep counts as latency
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=tap_key, mod=0, unicode="", arrival_time=tap_time))
+
+    def next_tap_time(self):
+        if self._next_tap_time is None or self.tap_rate <= 0:
+            return None
+        return self._next_tap_time
+
+    def begin_work(self):
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            self._traced_at_start = tracemalloc.get_traced_memory()[0]
+        self._work_start_time = time.perf_counter()
+
+    def after_present(self):
+        # Returns False once the run is over
+        now = time.perf_counter()
+        if self.trace_allocations:
+            traced, peak = tracemalloc.get_traced_memory()
+            self.alloc_peak_bytes.append(peak - self._traced_at_start)
+            self.alloc_retained_bytes.append(traced - self._traced_at_start)
+        else:
+            self.work_ms.append((now - self._work_start_time) * 1000.0)
+            if self._last_present_time is not None:
+                self.frame_ms.append((now - self._last_present_time) * 1000.0)
+        if self.startup_seconds is None:
+            self.startup_seconds = now - APP_START_TIME
+        self._last_present_time = now
+        self._frame_index += 1
+        return now - self._start_time < self.duration
+
+    def write_report(self):
+        report = {
+            "mode": self.mode,
+            "tap_rate": self.tap_rate,
+            "duration_seconds": self.duration,
+            "frames": self._frame_index,
+            "taps_sent": self.taps_sent,
+            "game_restarts": self.game_restarts,
+            "startup_seconds": self.startup_seconds,
+            "frame_ms": percentiles(self.frame_ms),
+            "work_ms": percentiles(self.work_ms),
+            "trace_allocations": self.trace_allocations,
+            "alloc_peak_bytes_per_frame": percentiles(self.alloc_peak_bytes),
+            "alloc_retained_bytes_per_frame": percentiles(self.alloc_retained_bytes),
+            "phase_ms": None if self.trace_allocations else profiler.phase_stats(),
+            "low_latency": cli_args.low_latency,
+            "prefetch_transforms": transform_worker.enabled,
+            "tap_latency": None if self.trace_allocations else tap_latency.report(),
+            "asset_memory_bytes": asset_memory.group_bytes(),
+            "asset_memory_peak_bytes": asset_memory.peak_bytes,
+            "video_driver": pygame.display.get_driver(),
+        }
+        with open(self.output_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"DEBUG: Benchmark report written to {self.output_path}")
+
+benchmark = None
+if cli_args.benchmark:
+    benchmark = BenchmarkDriver(cli_args.benchmark, cli_args.tap_rate, cli_args.duration, cli_args.benchmark_output,
+                                cli_args.benchmark_trace_allocations)
+
+# --- Session Telemetry ---
+class SessionTelemetry:
+    # Gameplay analytics for one session. record() and record_frame() only timestamp the
+    # event and put it on a bounded queue (never waiting: if the queue is full the event is
+    # dropped and counted). A background thread turns the events into JSON lines, flushing
+    # them in batches to append-only files that rotate past TELEMETRY_FILE_MAX_BYTES, and
+    # derives the summaries: taps per second and time to kill per game and player, slides
+    # visited, and frame-time percentiles for each stretch of the session in one mode.
+    def __init__(self, directory, session_info):
+        self.directory = directory
+        self.session_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.events_dropped = 0
+        self.lines_written = 0
+        self.files_written = 0
+        self._start_time = time.perf_counter()
+        self._queue = queue.Queue(TELEMETRY_QUEUE_SIZE)
+        # Owned by the writer thread
+        self._file = None
+        self._file_bytes = 0
+        self._write_failed = False
+        self._game = None # Taps and finish times of the running game
+        self._games_played = 0
+        self._slides_visited = []
+        self._frame_mode = None
+        self._frame_start = 0.0
+        self._frame_total_ms = array('d')
+        self._frame_work_ms = array('d')
+        os.makedirs(directory, exist_ok=True)
+        self.record("session_start", session_id=self.session_id, **session_info)
+        self._thread = threading.Thread(target=self._writer, name="telemetry-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, event, **fields):
+        try:
+            self._queue.put_nowait((time.perf_counter() - self._start_time, event, fields))
+        except queue.Full:
+            self.events_dropped += 1
+
+    def record_frame(self, mode, total_ms, work_ms):
+        # Frames are only aggregated by the writer, never written one by one
+        try:
+            self._queue.put_nowait((time.perf_counter() - self._start_time, None, (mode, total_ms, work_ms)))
+        except queue.Full:
+            self.events_dropped += 1
+
+    def close(self):
+        # At exit there is no frame to protect, so these two are allowed to wait for room
+        self._queue.put((time.perf_counter() - self._start_time, "session_end", {"events_dropped": self.events_dropped}))
+        self._queue.put(None)
+        self._thread.join()
+        print(f"DEBUG: Telemetry: {self.lines_written} lines in {self.files_written} file(s) under {self.directory}, "
+              f"{self.events_dropped} events dropped")
+
+    def _writer(self):
+        pending_lines = []
+        last_flush_time = time.perf_counter()
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=TELEMETRY_FLUSH_SECONDS)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                running = False
+            elif item:
+                pending_lines.extend(self._lines_for(*item))
+            now = time.perf_counter()
+            if pending_lines and (not running or len(pending_lines) >= TELEMETRY_BATCH_SIZE
+                                  or now - last_flush_time >= TELEMETRY_FLUSH_SECONDS):
+                self._write_lines(pending_lines)
+                pending_lines = []
+                last_flush_time = now
+        if self._file:
+            self._file.close()
+
+    def _lines_for(self, t, event, fields):
+        # The JSON-ready lines one queued event turns into
+        if event is None:
+            mode, total_ms, work_ms = fields
+            lines = []
+            if mode != self._frame_mode:
+                lines = self._frame_summary(t)
+                self._frame_mode, self._frame_start = mode, t
+            self._frame_total_ms.append(total_ms)
+            self._frame_work_ms.append(work_ms)
+            return lines
+
+        lines = [dict(t=round(t, 4), event=event, **fields)]
+        if event == "slide":
+            self._slides_visited.append(fields["slide"])
+        elif event == "game_start":
+            self._game = {"game": fields["game"], "start": t, "taps": {}, "finish": {}}
+            self._games_played += 1
+        elif event == "tap" and self._game:
+            self._game["taps"][fields["player"]] = self._game["taps"].get(fields["player"], 0) + 1
+        elif event == "player_finished" and self._game:
+            self._game["finish"][fields["player"]] = t
+        elif event == "game_end" and self._game:
+            lines.append(self._game_summary(t, completed=True))
+            self._game = None
+        elif event == "session_end":
+            if self._game: # Quit (ESC, window close, end of a benchmark run) in the middle of a game
+                lines.insert(0, self._game_summary(t, completed=False))
+                self._game = None
+            lines = self._frame_summary(t) + lines
+            lines.append({"t": round(t, 4), "event": "session_summary", "games_played": self._games_played,
+                          "slides_visited": self._slides_visited, "unique_slides": len(set(self._slides_visited))})
+        return lines
+
+    def _game_summary(self, t, completed):
+        game = self._game
+        summary_players = []
+        for player in sorted(set(game["taps"]) | set(game["finish"])):
+            finish_time = game["finish"].get(player)
+            seconds = (finish_time if finish_time is not None else t) - game["start"]
+            taps = game["taps"].get(player, 0)
+            summary_players.append({"player": player, "taps": taps,
+                                    "taps_per_second": round(taps / seconds, 3) if seconds > 0 else None,
+                                    "time_to_kill_seconds": round(seconds, 3) if finish_time is not None else None})
+        return {"t": round(t, 4), "event": "game_summary", "game": game["game"], "completed": completed,
+                "duration_seconds": round(t - game["start"], 3), "players": summary_players}
+
+    def _frame_summary(self, t):
+        if not self._frame_total_ms:
+            return []
+        line = {"t": round(t, 4), "event": "frames", "mode": self._frame_mode, "seconds": round(t - self._frame_start, 3),
+                "frame_ms": percentiles(self._frame_total_ms), "work_ms": percentiles(self._frame_work_ms)}
+        self._frame_total_ms, self._frame_work_ms = array('d'), array('d')
+        return [line]
+
+    def _write_lines(self, lines):
+        if self._write_failed:
+            return
+        try:
+            for line in lines:
+                text = json.dumps(line, separators=(",", ":")) + "\n"
+                if self._file is None or (self._file_bytes and self._file_bytes + len(text) > TELEMETRY_FILE_MAX_BYTES):
+                    self._open_next_file()
+                self._file.write(text)
+                self._file_bytes += len(text)
+                self.lines_written += 1
+            self._file.flush()
+        except OSError as e:
+            print(f"Warning: Telemetry writing stopped: {e!r}")
+            self._write_failed = True
+
+    def _open_next_file(self):
+        if self._file:
+            self._file.close()
+        self.files_written += 1
+        path = os.path.join(self.directory, f"session-{self.session_id}-{self.files_written:03d}.jsonl")
+        self._file = open(path, "a")
+        self._file_bytes = self._file.tell()
+
+telemetry = None
+if cli_args.telemetry_dir:
+    try:
+        telemetry = SessionTelemetry(cli_args.telemetry_dir, {
+            "players": len(players), "render_size": [SCREEN_WIDTH, SCREEN_HEIGHT], "slide_graph": cli_args.slide_graph,
+            "benchmark": cli_args.benchmark, "replay": cli_args.replay_input})
+        telemetry.record("slide", slide=current_slide_index)
+    except OSError as e:
+        print(f"Warning: Could not create telemetry directory '{cli_args.telemetry_dir}': {e!r}")
+
+# --- Session Video Capture ---
+class SessionVideoCapture:
+    # Records presented frames at a fixed frame rate without stalling the loop. capture()
+    # copies the screen's pixels straight from its buffer into one of a ring of preallocated
+    # frame buffers (no Surface or bytes object per frame) and hands it to a writer thread,
+    # which pipes it into the encoder or appends it to a raw file. Frames come in faster than
+    # fps are skipped; if every buffer is still waiting for the writer the frame is dropped
+    # (and counted). The writer repeats the previous frame across skipped, dropped and idle
+    # stretches, so the video keeps the session's real timing.
+    def __init__(self, path, surface, fps, ring_frames):
+        self.path = path
+        self.fps = fps
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self._surface = surface
+        self._width, self._height = surface.get_size()
+        self._pitch = surface.get_pitch()
+        self._pixel_format = self._raw_pixel_format(surface)
+        self._buffers = [bytearray(self._pitch * self._height) for _ in range(ring_frames)]
+        self._free = queue.Queue()
+        for index in range(ring_frames):
+            self._free.put(index)
+        self._filled = queue.Queue()
+        self._start_time = None
+        self._next_frame_number = 0
+        self._encoder = None
+        self._file = None
+        encoder_path = shutil.which(VIDEO_CAPTURE_ENCODER)
+        if encoder_path and not path.lower().endswith(".raw"):
+            self._encoder = subprocess.Popen(
+                [encoder_path, "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", self._pixel_format,
+                 "-s", f"{self._width}x{self._height}", "-r", f"{fps:g}", "-i", "-",
+                 "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path],
+                stdin=subprocess.PIPE)
+            self._output = self._encoder.stdin
+        else:
+            self._file = open(path, "wb")
+            self._output = self._file
+        self._write_failed = False
+        self._thread = threading.Thread(target=self._writer, name="video-writer", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _raw_pixel_format(surface):
+        # The encoder's name for the surface's byte order (4-byte pixels on little-endian machines)
+        if surface.get_bytesize() != 4 or sys.byteorder != "little":
+            raise ValueError(f"unsupported pixel layout ({surface.get_bytesize()} bytes per pixel)")
+        order = "bgr" if surface.get_shifts()[0] == 16 else "rgb"
+        return order + ("a" if surface.get_masks()[3] else "0")
+
+    def capture(self, now):
+        if self._start_time is None:
+            self._start_time = now
+        frame_number = int((now - self._start_time) * self.fps)
+        if frame_number < self._next_frame_number:
+            return # Decimated: this stretch of the video already has a frame
+        try:
+            index = self._free.get_nowait()
+        except queue.Empty:
+            self.frames_dropped += 1
+            return
+        with memoryview(self._surface.get_buffer()) as pixels:
+            self._buffers[index][:] = pixels
+        self._filled.put((frame_number, index))
+        self._next_frame_number = frame_number + 1
+        self.frames_captured += 1
+
+    def close(self):
+        self._filled.put(None)
+        self._thread.join()
+        if self._encoder:
+            try:
+                self._encoder.stdin.close()
+            except OSError:
+                pass
+            self._encoder.wait()
+        else:
+            self._file.close()
+            try:
+                with open(self.path + ".json", "w") as description_file:
+                    json.dump({"width": self._width, "height": self._height, "pixel_format": self._pixel_format,
+                               "fps": self.fps, "frames": self.frames_written}, description_file, indent=2)
+            except OSError as e:
+                print(f"Warning: Could not describe the raw capture in '{self.path}.json': {e!r}")
+        print(f"DEBUG: Video capture: {self.frames_written} frames written to {self.path} "
+              f"({self.frames_captured} captured, {self.frames_dropped} dropped while the writer was behind)")
+
+    def _writer(self):
+        previous = None # (frame_number, buffer index) held until the next frame says how long it lasted
+        while True:
+            item = self._filled.get()
+            if previous is not None:
+                repeats = item[0] - previous[0] if item is not None else 1
+                self._write(previous[1], repeats)
+                self._free.put(previous[1])
+            if item is None:
+                return
+            previous = item
+
+    def _write(self, index, repeats):
+        if self._write_failed:
+            return
+        frame = memoryview(self._buffers[index])
+        row_bytes = self._width * 4
+        try:
+            for _ in range(repeats):
+                if self._pitch == row_bytes:
+                    self._output.write(frame)
+                else: # Strip the padding at the end of each row
+                    for row_start in range(0, len(frame), self._pitch):
+                        self._output.write(frame[row_start:row_start + row_bytes])
+                self.frames_written += 1
+        except OSError as e:
+            print(f"Warning: Video capture stopped: {e!r}")
+            self._write_failed = True
+
+video_capture = None
+if cli_args.capture_video:
+    if texture_renderer:
+        print("Warning: --capture-video needs the surface render backend; not capturing.")
     else:
-        r = 255
-        g = int(255 * (health_ratio * 2))
-    bar_color_ei = (max(0, min(255, r)), max(0, min(255, g)), 0)
-    
-    pygame.draw.rect(screen, BLACK, (HEALTH_BAR_POS_EI[0]-2, HEALTH_BAR_POS_EI[1]-2, HEALTH_BAR_SIZE_EI[0]+4, HEALTH_BAR_SIZE_EI[1]+4))
-    pygame.draw.rect(screen, bar_color_ei, (HEALTH_BAR_POS_EI[0], HEALTH_BAR_POS_EI[1], current_bar_width_ei, HEALTH_BAR_SIZE_EI[1]))
-
-    health_text_surf_ei = game_font_large.render(f"{int(health)}%", True, WHITE)
-    health_text_rect_ei = health_text_surf_ei.get_rect(midright=(HEALTH_BAR_POS_EI[0] - 30, HEALTH_BAR_POS_EI[1] + HEALTH_BAR_SIZE_EI[1] // 2))
-    screen.blit(health_text_surf_ei, health_text_rect_ei)
-
-    if tap_button_flash_timer > 0:
-        # Ensure TAP_BUTTON_VISUAL_RECT is defined appropriately for this game's "TAP!" button
-        flash_surface = pygame.Surface(TAP_BUTTON_VISUAL_RECT.size, pygame.SRCALPHA)
-        flash_surface.fill(FLASH_COLOR)
-        screen.blit(flash_surface, TAP_BUTTON_VISUAL_RECT.topleft)
-        tap_button_flash_timer -= 1
+        try:
+            video_capture = SessionVideoCapture(cli_args.capture_video, screen, cli_args.capture_fps, VIDEO_CAPTURE_RING_FRAMES)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not start video capture to '{cli_args.capture_video}': {e!r}")
 
 # --- Main Game Loop ---
 clock = pygame.time.Clock()
 running = True
 DEBUG_DRAW_BUTTON_RECTS = False # Set to True to see button hitboxes
 
+def wait_for_slideshow_events(next_input_time=None):
+    # Blocks until input arrives (or the attract-rate timeout passes) so an idle slide costs no CPU.
+    # next_input_time (the benchmark's next synthetic click) cuts the wait short.
+    timeout_ms = int(1000 / SLIDESHOW_ATTRACT_FPS) if SLIDESHOW_ATTRACT_FPS > 0 else 0
+    if next_input_time is not None:
+        input_due_ms = int((next_input_time - time.perf_counter()) * 1000)
+        if input_due_ms <= 0:
+            return pygame.event.get() # pygame.event.wait(0) would block until input
+        timeout_ms = min(timeout_ms, input_due_ms) if timeout_ms else input_due_ms
+    first_event = pygame.event.wait(timeout_ms)
+    if first_event.type == pygame.NOEVENT:
+        return []
+    return [first_event] + pygame.event.get()
+
+def paint_slide_background():
+    screen.blit(slide_images[current_slide_index], (0, 0))
+    if DEBUG_DRAW_BUTTON_RECTS: # Draw button rects if debug is on
+        for btn_data in slide_graph.buttons_by_slide[current_slide_index]:
+            if texture_renderer:
+                screen.draw_rect((255,0,0,100), btn_data["rect"], 2)
+            else:
+                pygame.draw.rect(screen, (255,0,0,100), btn_data["rect"], 2) # Semi-transparent red border
+
+def paint_invalid_slide_background():
+    screen.fill(LIGHT_GRAY)
+    error_font = pygame.font.Font(None, render_length(72))
+    text_surf = error_font.render(f"Error: Invalid slide index {current_slide_index}", True, BLACK)
+    text_rect = text_surf.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
+    screen.blit(text_surf, text_rect)
+
+session_frame = 0
 while running:
-    mouse_pos = pygame.mouse.get_pos()
-    # dt = clock.tick(60) / 1000.0 # dt is not used, can be removed if not planned for physics
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
+    profiler.begin_frame()
+    paced_frame = frame_pacer is not None and current_mode in GAME_SCENES and not input_replay
+    waited_events = []
+    if paced_frame:
+        waited_events = frame_pacer.wait_for_frame(benchmark.next_tap_time() if benchmark else None)
+        profiler.lap("tick") # The frame cap sleep, moved in front of the event pump
+    if benchmark:
+        benchmark.before_events()
+    if input_replay:
+        # Logged input only; live events are limited to closing and repainting the window
+        input_replay.begin_frame(session_frame)
+        events = input_replay.events_for(session_frame)
+        events += [event for event in pygame.event.get() if event.type in (pygame.QUIT, pygame.WINDOWCLOSE, pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED)]
+    elif current_mode == "slideshow" and SLIDESHOW_IDLE_WAIT:
+        events = wait_for_slideshow_events(benchmark.next_tap_time() if benchmark else None)
+    else: # Games keep their real-time loop
+        events = waited_events + pygame.event.get()
+    pump_time = time.perf_counter() # Arrival time of input not stamped during frame_pacer's wait (SDL's event timestamps are not exposed)
+    if input_recorder:
+        input_recorder.begin_frame()
+        input_recorder.capture_events(events)
+    profiler.lap("pump")
+    if benchmark:
+        benchmark.begin_work()
+
+    for event in events:
+        if event.type in (pygame.QUIT, pygame.WINDOWCLOSE): # The texture backend's window only sends WINDOWCLOSE
             running = False
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            renderer.invalidate()
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
                 running = False
+            if event.key == PROFILER_OVERLAY_KEY:
+                profiler.toggle_overlay()
+            if event.key == ASSET_MEMORY_REPORT_KEY:
+                print_asset_memory_report()
 
             if current_mode == "slideshow":
-                game_to_start_now = None
-                # Check if current slide is one of the game info slides
-                # Slide 3: Oxidative Stress Info (then game starts on slide 4 implicitly by space)
-                # Slide OSMOTIC_GAME_INFO_SLIDE_INDEX (10): Osmotic Shock Info
-                # Slide ENZYME_GAME_INFO_SLIDE_INDICES (6, 7): Enzyme Inhibition Info
-                if event.key == pygame.K_SPACE:
-                    if current_slide_index == 3: # Info for Oxidative Stress
-                        start_game("oxidative_stress")
-                        # No slide change here, game mode handles drawing
-                    elif current_slide_index == OSMOTIC_GAME_INFO_SLIDE_INDEX: # Info for Osmotic
-                        start_game("osmotic_shock")
-                    elif current_slide_index in ENZYME_GAME_INFO_SLIDE_INDICES: # Info for Enzyme
-                        start_game("enzyme_inhibition")
-                    # If game started, continue to next iteration of main loop
-                    if active_game_type:
-                        continue
+                # Game-start keys for the current slide come from slide_graph
+                game_to_start_now = slide_graph.game_for_key(current_slide_index, event.key)
+                if game_to_start_now:
+                    start_game(game_to_start_now)
+                    continue # Game mode handles drawing from here on
             
-            elif current_mode in ["game_oxidative_stress", "game_osmotic_shock", "game_enzyme_inhibition"]:
-                if event.key == pygame.K_SPACE:
-                    if space_tap_sound.get_num_channels() < 8 : # Limit concurrent plays
-                         space_tap_sound.play()
-                    health -= DAMAGE_PER_TAP
-                    health = max(health, HEALTH_MIN) # Clamp health
-                    tap_button_flash_timer = FLASH_DURATION_FRAMES
+            elif current_mode in GAME_SCENES:
+                tapping_player = players_by_key.get(event.key)
+                if tapping_player and tapping_player.finish_rank is None:
+                    audio.play_tap()
+                    tapping_player.sim.tap()
+                    tap_latency.tap_applied(current_mode, getattr(event, "arrival_time", pump_time))
+                    if telemetry:
+                        telemetry.record("tap", game=active_game_type, player=tapping_player.number,
+                                         health=round(tapping_player.sim.health, 1))
 
 
         if event.type == pygame.MOUSEBUTTONDOWN and current_mode == "slideshow":
             if event.button == 1: # Left click
-                for button_data in buttons:
-                    # Check if button is visible on the current slide
-                    if current_slide_index in button_data.get("visible_on_slides", []):
-                        if button_data["rect"].collidepoint(mouse_pos):
-                            if button_beep_sound.get_num_channels() < 4:
-                                button_beep_sound.play()
-                            
-                            action = button_data.get("action")
-                            if action == "goto_slide":
-                                target_slide_index = button_data.get("target_slide")
-                                
-                                # Special handling for game start slides to prevent accidental skip via button
-                                # if current_slide_index == 3 and target_slide_index == 4: # OS info to OS boom
-                                #     # This button should ideally lead to the game, not boom slide directly
-                                #     # Or, spacebar starts game, button click on info slide is disabled or also starts game
-                                #     pass # Let spacebar handle game start
-                                # elif current_slide_index == OSMOTIC_GAME_INFO_SLIDE_INDEX and target_slide_index == OSMOTIC_GAME_BOOM_SLIDE_INDEX:
-                                #     pass
-                                # elif current_slide_index in ENZYME_GAME_INFO_SLIDE_INDICES and target_slide_index == ENZYME_GAME_BOOM_SLIDE_INDEX:
-                                #     pass
-                                # else: # Default button action
-                                if 0 <= target_slide_index < total_slides:
-                                    current_slide_index = target_slide_index
-                                else:
-                                    print(f"Warning: Button '{button_data['id']}' target {target_slide_index} out of bounds.")
-                            break # Found clicked button
-
-    # Game Logic Update
-    if current_mode == "game_oxidative_stress":
-        update_oxidative_stress_game()
-    elif current_mode == "game_osmotic_shock":
-        update_osmotic_shock_game()
-    elif current_mode == "game_enzyme_inhibition":
-        update_enzyme_inhibition_game()
-
-    # Drawing
-    screen.fill(BLACK) # Default background, might be overwritten
+                mouse_pos = event.pos # Position at click time (the slideshow may have been waiting for it)
+                button_data = slide_graph.hit_test(current_slide_index, mouse_pos)
+                if button_data:
+                    audio.play_beep()
+
+                    action = button_data.get("action")
+                    if action == "goto_slide":
+                        current_slide_index = button_data["target_slide"] # Checked when the graph was loaded
+                        if telemetry:
+                            telemetry.record("slide", slide=current_slide_index)
+                        for game_type in slide_graph.games_started_from(current_slide_index):
+                            if game_type in GAME_ASSET_PREFETCH:
+                                GAME_ASSET_PREFETCH[game_type]()
+
+    profiler.lap("events")
+
+    # Game Logic Update: run every simulation tick that is due, then draw once (interpolated)
+    if current_mode in GAME_SCENES:
+        for _ in range(advance_players(session_clock())):
+            for player in players:
+                player.sim.tick()
+            update_game_players()
+            if current_mode not in GAME_SCENES: # Game ended on this tick
+                break
+
+    profiler.lap("update")
+
+    # Drawing (each scene paints its own background through the renderer)
     if current_mode == "slideshow":
+        # Static slides have nothing on top of the background, so unchanged slides push no pixels
         if 0 <= current_slide_index < total_slides:
-            screen.blit(slide_images[current_slide_index], (0, 0))
-            if DEBUG_DRAW_BUTTON_RECTS: # Draw button rects if debug is on
-                for btn_data in buttons:
-                    if current_slide_index in btn_data.get("visible_on_slides", []):
-                        pygame.draw.rect(screen, (255,0,0,100), btn_data["rect"], 2) # Semi-transparent red border
+            renderer.begin_frame(("slideshow", current_slide_index), paint_slide_background)
         else: # Fallback if slide index is out of bounds
-            screen.fill(LIGHT_GRAY)
-            error_font = pygame.font.Font(None, 72)
-            text_surf = error_font.render(f"Error: Invalid slide index {current_slide_index}", True, BLACK)
-            text_rect = text_surf.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-            screen.blit(text_surf, text_rect)
-            
-    elif current_mode == "game_oxidative_stress":
-        draw_oxidative_stress_game_elements()
-    elif current_mode == "game_osmotic_shock":
-        draw_osmotic_shock_game_elements()
-    elif current_mode == "game_enzyme_inhibition":
-        draw_enzyme_inhibition_game_elements()
-
-    pygame.display.flip()
-    clock.tick(60) # Cap FPS
-
+            renderer.begin_frame(("invalid_slide", current_slide_index), paint_invalid_slide_background)
+
+    elif current_mode in GAME_SCENES:
+        draw_game_players()
+
+    overlay_rect = profiler.draw_overlay(screen)
+    if overlay_rect:
+        renderer.mark(overlay_rect)
+    profiler.lap("draw")
+
+    renderer.present()
+    present_time = time.perf_counter()
+    tap_latency.frame_presented(present_time)
+    if paced_frame:
+        frame_pacer.frame_presented(present_time)
+    if video_capture:
+        video_capture.capture(present_time)
+    profiler.lap("present")
+    if benchmark and not benchmark.after_present():
+        running = False
+    if input_recorder:
+        input_recorder.end_frame(session_frame)
+    if input_replay and input_replay.finished(session_frame):
+        running = False
+    clock.tick(0 if input_replay or paced_frame else GAME_FPS) # Cap FPS (replays are paced by the log, if at all; game frames wait in frame_pacer)
+    profiler.lap("tick")
+    profiler.end_frame(current_mode)
+    if telemetry:
+        telemetry.record_frame(current_mode, *profiler.last_frame_ms())
+    session_frame += 1
+
+if benchmark:
+    benchmark.write_report()
+if input_recorder:
+    input_recorder.close()
+if input_replay and not input_replay.diverged:
+    print(f"DEBUG: Replayed {session_frame} frames from {input_replay.path}")
+if cli_args.profile_csv:
+    profiler.write_csv(cli_args.profile_csv)
+for line in tap_latency.summary_lines():
+    print(f"DEBUG: {line}")
+if telemetry:
+    telemetry.close()
+if video_capture:
+    video_capture.close()
+
+# Let in-flight asset loaders finish before pygame shuts down underneath them
+concurrent.futures.wait(asset_group_futures.values())
+transform_worker.stop()
+for transform_cache in (scale_balance_rotations, bacteria_osmo_scales, osmotic_backgrounds, enzyme_layers):
+    if transform_cache is not None: # None if its asset group failed to load
+        print(f"DEBUG: {transform_cache.stats_line()}")
+print(f"DEBUG: {asset_cache.stats_line()}")
+print(f"DEBUG: {audio.stats_line()}")
+if texture_renderer:
+    print(f"DEBUG: Texture backend: {screen.textures_uploaded} textures uploaded")
+print_asset_memory_report()
 pygame.quit()
 sys.exit()
\ No newline at end of file
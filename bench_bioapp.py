@@ -0,0 +1,108 @@
+import sys
+import os
+import argparse
+import json
+import subprocess
+import tempfile
+import time
+
+# Runs BioApp2.py headless once per (mode, tap rate) and collects the per-run JSON reports
+# into a single machine-readable results file.
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "BioApp2.py")
+DEFAULT_MODES = ["slideshow", "game_oxidative_stress", "game_osmotic_shock", "game_enzyme_inhibition"]
+DEFAULT_TAP_RATES = [0.0, 4.0, 8.0, 15.0] # Taps (or slide clicks) per second
+ALLOCATION_PASS_MAX_SECONDS = 5.0 # The traced pass only needs enough frames for allocation percentiles
+ALLOCATION_FIELDS = ["alloc_peak_bytes_per_frame", "alloc_retained_bytes_per_frame"]
+
+def run_benchmark(mode, tap_rate, duration, work_dir, render_size=None, players=1, render_backend="surface", low_latency=False,
+                  prefetch_transforms=False, trace_allocations=False):
+    report_path = os.path.join(work_dir, f"{mode}_{tap_rate:g}{'_alloc' if trace_allocations else ''}.json")
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    command = [sys.executable, APP_SCRIPT, "--benchmark", mode, "--tap-rate", str(tap_rate),
+               "--duration", str(duration), "--benchmark-output", report_path]
+    if render_size:
+        command += ["--render-size", render_size]
+    if players > 1:
+        command += ["--players", str(players)]
+    if render_backend != "surface":
+        command += ["--render-backend", render_backend]
+    if low_latency:
+        command.append("--low-latency")
+    if prefetch_transforms:
+        command.append("--prefetch-transforms")
+    if trace_allocations:
+        command.append("--benchmark-trace-allocations")
+    launch_time = time.perf_counter()
+    completed = subprocess.run(command, cwd=APP_DIR, env=env, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - launch_time
+    if completed.returncode != 0 or not os.path.exists(report_path):
+        print(f"Error: benchmark {mode} @ {tap_rate:g} taps/s failed (exit code {completed.returncode})")
+        print(completed.stderr[-2000:])
+        return {"mode": mode, "tap_rate": tap_rate, "error": completed.stderr[-2000:], "exit_code": completed.returncode}
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    report["process_wall_seconds"] = wall_seconds
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless performance benchmark for BioApp2")
+    parser.add_argument("--modes", nargs="+", choices=DEFAULT_MODES, default=DEFAULT_MODES)
+    parser.add_argument("--tap-rates", nargs="+", type=float, default=DEFAULT_TAP_RATES)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--render-size", help="Internal render resolution passed to BioApp2.py (e.g. 1280x720)")
+    parser.add_argument("--players", type=int, choices=[1, 2, 3, 4], default=1, help="Classroom split-screen player count")
+    parser.add_argument("--render-backend", choices=["surface", "texture", "texture-software"], default="surface",
+                        help="Rendering backend passed to BioApp2.py")
+    parser.add_argument("--low-latency", action="store_true", help="Run BioApp2.py with --low-latency frame pacing")
+    parser.add_argument("--prefetch-transforms", action="store_true", help="Run BioApp2.py with the transform prefetch worker")
+    parser.add_argument("--skip-allocations", action="store_true",
+                        help="Skip the second, tracemalloc-traced run per mode that measures per-frame allocations")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode in args.modes:
+            for tap_rate in args.tap_rates:
+                report = run_benchmark(mode, tap_rate, args.duration, work_dir, args.render_size, args.players,
+                                      args.render_backend, args.low_latency, args.prefetch_transforms)
+                if "error" not in report and not args.skip_allocations:
+                    # Tracing slows every frame, so allocations come from a separate run whose timings are discarded
+                    alloc_report = run_benchmark(mode, tap_rate, min(args.duration, ALLOCATION_PASS_MAX_SECONDS), work_dir,
+                                                 args.render_size, args.players, args.render_backend, args.low_latency,
+                                                 args.prefetch_transforms, trace_allocations=True)
+                    for field in ALLOCATION_FIELDS:
+                        report[field] = alloc_report.get(field)
+                    if "error" in alloc_report:
+                        report["allocation_pass_error"] = alloc_report["error"]
+                results.append(report)
+                if "error" not in report:
+                    work = report["work_ms"] or {}
+                    print(f"{mode:<24} {tap_rate:>5g} taps/s  startup {report['startup_seconds']:.2f}s  "
+                          f"work p50 {work.get('p50', 0):.2f} ms  p99 {work.get('p99', 0):.2f} ms"
+                          + (f"  alloc peak p50 {report['alloc_peak_bytes_per_frame']['p50']} B"
+                             if report.get("alloc_peak_bytes_per_frame") else "")
+                          + "".join(f"  tap latency p50 {latency['latency_ms']['p50']:.1f} ms  p95 {latency['latency_ms']['p95']:.1f} ms"
+                                    for latency in report.get("tap_latency", {}).values()))
+
+    summary = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "duration_seconds": args.duration,
+        "render_size": args.render_size,
+        "players": args.players,
+        "render_backend": args.render_backend,
+        "low_latency": args.low_latency,
+        "prefetch_transforms": args.prefetch_transforms,
+        "runs": results,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(summary, output_file, indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if any("error" in report for report in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())